@@ -0,0 +1 @@
+"""Outils de mesure hors ligne : benchmarks des commandes et rejeu de charge."""
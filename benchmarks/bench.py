@@ -0,0 +1,262 @@
+"""Benchmarks du stockage et des commandes sur des bibliothèques synthétiques.
+
+Chaque commande est appelée par les substituts de `fakes`, hooks compris, sur
+des listes de 10 à 100 000 médias. Pour chaque taille et chaque scénario sont
+relevés : la latence (premier appel, médiane, 95e centile), le pic
+d'allocations mesuré par tracemalloc lors d'un passage séparé, et les octets lus
+et écrits par le stockage avec leur débit, d'après le registre de métriques.
+
+    python -m benchmarks.bench --backend json --sizes 10,1000,100000
+    python -m benchmarks.bench --save-baseline     # enregistre la référence
+    python -m benchmarks.bench                     # compare à la référence
+
+Les résultats sont fusionnés dans le fichier de sortie sous les clés
+« stockage/taille/scénario », ce qui permet de comparer les stockages en
+lançant une exécution par stockage. La sortie est non nulle en cas de
+régression de la médiane au-delà du seuil.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import ROOT, invoke, load_bot
+from benchmarks.synthetic import populate
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results.json")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Serveur fictif des commandes /watchers et /top
+BENCH_GUILD_ID = 1
+
+# Écart absolu en dessous duquel une hausse de la médiane n'est pas une régression
+NOISE_FLOOR_MS = 0.05
+
+def percentile(values, q):
+    """Centile par rang le plus proche."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+def io_snapshot(metrics):
+    """Relève les octets lus et écrits et le temps passé dans le stockage."""
+    return (
+        sum(metrics.counters("watchtrack_storage_bytes_read_total", "op").values()),
+        sum(metrics.counters("watchtrack_storage_bytes_written_total", "op").values()),
+        sum(histogram.sum for histogram in metrics.histograms("watchtrack_storage_seconds", "op").values()),
+    )
+
+def command_scenarios(library):
+    """Retourne [(scénario, commande, fonction donnant les arguments du i-ème appel)]."""
+    # Un média de chaque catégorie sert aux commandes qui en désignent un
+    named = {category: entry['nom'] for category, entry in reversed(library)}
+    serie = named.get('séries', library[0][1]['nom'])
+    # /next n'avance que les médias en cours
+    manga = next((entry['nom'] for category, entry in library if category == 'mangas' and entry['statut'] == 'en cours'), serie)
+    return [
+        ("add", "add", lambda i: {'type': 'film', 'nom': f"Ajout Benchmark {i}", 'statut': 'prévu'}),
+        ("add_duplicate", "add", lambda i: {'type': 'série', 'nom': serie, 'statut': 'prévu'}),
+        ("edit", "edit", lambda i: {'type': 'série', 'nom': serie, 'action': 'éditer', 'statut': 'en cours', 'saison': 1, 'episode': i + 1}),
+        ("list", "list", lambda i: {'order': 'asc'}),
+        ("filter", "filter", lambda i: {'media_type': 'anime', 'order': 'desc', 'statut': 'en cours'}),
+        ("search", "search", lambda i: {'recherche': 'fantome'}),
+        ("stats", "stats", lambda i: {}),
+        ("watchers", "watchers", lambda i: {'nom': serie}),
+        ("top", "top", lambda i: {}),
+        ("export_csv", "export", lambda i: {'export_format': 'csv'}),
+        ("export_json", "export", lambda i: {'export_format': 'json'}),
+        # En dernier : les autres commandes écriraient aussitôt la progression en attente
+        ("next", "next", lambda i: {'type': 'manga' if manga != serie else 'série', 'nom': manga}),
+    ]
+
+async def measure(bot, call, repeat):
+    """Appelle `repeat` fois une coroutine, puis une fois sous tracemalloc."""
+    gc.collect()
+    read, written, seconds = io_snapshot(bot.metrics)
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await call(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    read_after, written_after, seconds_after = io_snapshot(bot.metrics)
+    # Passage séparé : tracemalloc ralentit fortement les allocations
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await call(repeat)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    io_bytes = (read_after - read) + (written_after - written)
+    io_seconds = seconds_after - seconds
+    return {
+        'first_ms': round(latencies[0], 3),
+        'median_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'peak_kib': round(peak / 1024, 1),
+        'read_kib': round((read_after - read) / 1024 / repeat, 1),
+        'written_kib': round((written_after - written) / 1024 / repeat, 1),
+        'io_mib_s': round(io_bytes / io_seconds / 1024 / 1024, 1) if io_bytes and io_seconds else None,
+    }
+
+def fresh_storage(bot):
+    """Crée une instance de stockage neuve, sans cache, sur les mêmes fichiers."""
+    if bot.STORAGE_BACKEND == "sqlite":
+        return bot.SqliteStorage(bot.SQLITE_PATH)
+    if bot.STORAGE_BACKEND == "journal":
+        return bot.JournalStorage(bot.UserDataCache(), compact_records=bot.JOURNAL_COMPACT_RECORDS)
+    return bot.JsonStorage(bot.UserDataCache())
+
+async def bench_size(bot, size, repeat, seed):
+    """Mesure tous les scénarios pour une liste de `size` médias ; retourne {scénario: mesures}."""
+    user_id = 10_000_000 + size
+    start = time.perf_counter()
+    library = await populate(bot.storage, user_id, size, seed)
+    print(f"  {size} médias générés en {time.perf_counter() - start:.2f} s")
+    bot.title_index.add_member(BENCH_GUILD_ID, user_id)
+    results = {}
+
+    async def cold_load(i):
+        storage = fresh_storage(bot)
+        try:
+            await storage.load(user_id)
+        finally:
+            storage.close()
+    results['cold_load'] = await measure(bot, cold_load, repeat)
+
+    for scenario, command, arguments in command_scenarios(library):
+        async def call(i, command=command, arguments=arguments):
+            await invoke(bot, command, user_id, BENCH_GUILD_ID, **arguments(i))
+        results[scenario] = await measure(bot, call, repeat)
+
+    # Une seule écriture regroupe tous les incréments de /next
+    start = time.perf_counter()
+    await bot.progress.settle_all()
+    results['next_settle'] = {'first_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+    category, entry = library[0]
+    async def flush(i):
+        # Modification en mémoire pour les stockages par fichier : le temps mesuré est surtout celui de l'écriture
+        await bot.storage.replace(user_id, category, dict(entry, statut='terminé' if i % 2 else 'prévu'))
+        await bot.storage.flush()
+    results['flush'] = await measure(bot, flush, repeat)
+    return results
+
+async def run(backend, sizes, repeat, seed):
+    bot = load_bot(backend, PROGRESS_DEBOUNCE=3600, PROGRESS_MAX_DELAY=3600, CACHE_MAX_USERS=len(sizes) + 8)
+    try:
+        results = {}
+        for size in sizes:
+            print(f"{backend} — {size} médias")
+            for scenario, measures in (await bench_size(bot, size, repeat, seed)).items():
+                results[f"{backend}/{size}/{scenario}"] = measures
+        return results
+    finally:
+        bot.storage.close()
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results(path):
+    if not os.path.exists(path):
+        return {'meta': {}, 'results': {}}
+    with open(path, "r") as file:
+        return json.load(file)
+
+def save_results(path, results, meta):
+    """Fusionne les résultats dans le fichier, en remplaçant les clés mesurées à nouveau."""
+    content = load_results(path)
+    content['meta'] = meta
+    content['results'].update(results)
+    with open(path, "w") as file:
+        json.dump(content, file, indent=2, ensure_ascii=False, sort_keys=True)
+        file.write("\n")
+
+def print_results(results):
+    columns = ['first_ms', 'median_ms', 'p95_ms', 'peak_kib', 'read_kib', 'written_kib', 'io_mib_s']
+    width = max(len(key) for key in results) + 2
+    print("".join(["clé".ljust(width)] + [column.rjust(12) for column in columns]))
+    for key, measures in results.items():
+        cells = (measures.get(column) for column in columns)
+        print("".join([key.ljust(width)] + ["-".rjust(12) if cell is None else str(cell).rjust(12) for cell in cells]))
+
+def compare(results, baseline, threshold):
+    """Affiche l'évolution des médianes par rapport à la référence ; retourne les régressions."""
+    regressions = []
+    for key, measures in results.items():
+        reference = baseline.get(key, {}).get('median_ms')
+        current = measures.get('median_ms')
+        if reference is None or current is None:
+            continue
+        ratio = current / reference if reference else float('inf')
+        regressed = ratio > 1 + threshold and current - reference > NOISE_FLOOR_MS
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<40} {reference:>10.3f} → {current:>10.3f} ms  ({ratio - 1:+.0%}){'  RÉGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du stockage et des commandes de Watchtrack")
+    parser.add_argument("--backend", choices=["json", "journal", "sqlite"], default="json")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Tailles des listes, séparées par des virgules")
+    parser.add_argument("--repeat", type=int, default=20, help="Appels mesurés par scénario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistre aussi les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Hausse relative de la médiane tolérée")
+    parser.add_argument("--workdir", help="Répertoire des données générées (temporaire par défaut)")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    # Chemins absolus : les données sont générées dans un autre répertoire
+    output, baseline_path = os.path.abspath(args.output), os.path.abspath(args.baseline)
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="watchtrack-bench-") as temporary:
+        os.chdir(args.workdir or temporary)
+        try:
+            results = asyncio.run(run(args.backend, sizes, max(1, args.repeat), args.seed))
+        finally:
+            os.chdir(previous)
+
+    meta = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'repeat': args.repeat,
+        'seed': args.seed,
+    }
+    print()
+    print_results(results)
+    save_results(output, results, meta)
+    if args.save_baseline:
+        save_results(baseline_path, results, meta)
+        print(f"\nRéférence enregistrée dans {baseline_path}")
+        return 0
+    baseline = load_results(baseline_path)['results']
+    if not baseline:
+        return 0
+    print(f"\nComparaison avec {baseline_path} (seuil {args.threshold:.0%})")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} régression(s) : {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Substituts locaux des interactions Discord, pour appeler les commandes sans passerelle."""
+import importlib
+import inspect
+import itertools
+import os
+import sys
+
+from nextcord import SlashOption
+from nextcord.application_command import SlashApplicationCommand
+from nextcord.utils import MISSING
+
+# Racine du dépôt, pour importer bot.py depuis n'importe quel répertoire de travail
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.name = f"utilisateur{user_id}"
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeMessage:
+    """Message envoyé : garde le contenu pour les vérifications."""
+
+    def __init__(self, content=None, **kwargs):
+        self.content = content
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.kwargs.update(kwargs)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        message = FakeMessage(content, **kwargs)
+        self._interaction.sent.append(message)
+        return message
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self._interaction.sent.append(FakeMessage(None, **kwargs))
+
+    async def send_autocomplete(self, choices):
+        self._done = True
+        self._interaction.sent.append(FakeMessage(None, choices=choices))
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content, **kwargs)
+        self._interaction.sent.append(message)
+        return message
+
+
+class FakeInteraction:
+    """Interaction minimale : utilisateur, serveur éventuel, réponse et suivi."""
+
+    def __init__(self, user_id, guild_id=None, command=None):
+        self.id = next(_ids)
+        self.user = FakeUser(user_id)
+        self.guild = FakeGuild(guild_id) if guild_id is not None else None
+        self.guild_id = guild_id
+        self.application_command = command
+        self.data = None
+        self.sent = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+def load_bot(backend="json", **env):
+    """Importe bot.py avec le stockage demandé, dans le répertoire de travail courant.
+
+    Le bot ne se connecte pas : bot.run() est protégé par `if __name__ == "__main__"`.
+    """
+    os.environ["STORAGE_BACKEND"] = backend
+    for name, value in env.items():
+        os.environ[name] = str(value)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("bot")
+
+
+def command_kwargs(command, **kwargs):
+    """Complète les arguments d'une commande avec les valeurs par défaut de ses options."""
+    for name, parameter in list(inspect.signature(command.callback).parameters.items())[1:]:
+        if name in kwargs:
+            continue
+        default = parameter.default
+        if isinstance(default, SlashOption):
+            # Une option facultative sans valeur par défaut est reçue comme None
+            default = None if default.default is MISSING else default.default
+        kwargs[name] = default
+    return kwargs
+
+
+def application_commands(bot_module):
+    """Retourne {nom: commande} pour les commandes slash déclarées dans bot.py."""
+    commands = {}
+    for value in vars(bot_module).values():
+        if isinstance(value, SlashApplicationCommand):
+            commands[value.name or value.callback.__name__] = value
+    return commands
+
+
+class FakeCommand:
+    """Commande vue par les hooks : seul son nom est utilisé."""
+
+    def __init__(self, name):
+        self.name = name
+        self.options = {}
+
+    def __str__(self):
+        return self.name
+
+
+async def invoke(bot_module, name, user_id, guild_id=None, **kwargs):
+    """Exécute une commande slash comme le ferait nextcord, hooks avant et après compris.
+
+    Retourne l'interaction, dont `sent` contient les messages envoyés.
+    """
+    command = application_commands(bot_module)[name]
+    interaction = FakeInteraction(user_id, guild_id, FakeCommand(name))
+    await bot_module.track_guild_member(interaction)
+    await bot_module.before_application_command(interaction)
+    try:
+        await command.callback(interaction, **command_kwargs(command, **kwargs))
+    except Exception as error:
+        await bot_module.count_command_error(interaction, error)
+        raise
+    finally:
+        await bot_module.after_application_command(interaction)
+    return interaction
@@ -0,0 +1,163 @@
+"""Vérifications de la reprise du mode journalisé après un arrêt brutal.
+
+Chaque vérification prépare dans un répertoire temporaire l'état laissé par
+un arrêt à un moment précis, puis relit les données comme au redémarrage :
+enregistrement final tronqué, instantané plus récent qu'une partie du journal,
+arrêt entre le renommage de l'instantané et la suppression du journal.
+
+    python -m benchmarks.journal_checks
+
+La sortie est non nulle si une vérification échoue.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+from cache import UserDataCache
+from journal import (JournalStorage, append_journal, encode_record, journal_path, read_journal,
+                     write_snapshot)
+from media import MediaEntry, Status
+from stats import UserStats
+from storage import DATA_DIR, empty_user_data, index_user_data
+
+USER_ID = 1
+
+def entry(nom, statut, **progress):
+    return MediaEntry(nom, Status(statut), **progress)
+
+def records_lines(records, first_seq=1):
+    return [encode_record(seq, record) for seq, record in enumerate(records, first_seq)]
+
+def state(index):
+    """Retourne les médias indexés sous une forme comparable : {(catégorie, nom): dictionnaire}."""
+    return {(category, media.nom): media.to_dict() for category, medias in index.items() for media in medias.values()}
+
+def stats_violation(index):
+    expected = UserStats.from_index(index)
+    if index.stats != expected:
+        return f"statistiques {index.stats!r} au lieu de {expected!r}"
+    return None
+
+def check_truncated_record():
+    """Un enregistrement coupé en fin de journal est ignoré, les précédents sont rejoués."""
+    append_journal(USER_ID, records_lines([
+        ('put', 'séries', entry("Dark", 'en cours', saison=1, episode=3)),
+        ('put', 'films', entry("Alien", 'prévu')),
+        ('del', 'films', "Alien"),
+    ]))
+    partial = encode_record(4, ('put', 'séries', entry("Dark", 'en cours', saison=1, episode=4)))
+    append_journal(USER_ID, [partial[:len(partial) // 2]])
+
+    index, seq, replayed = read_journal(USER_ID)
+    if (seq, replayed) != (3, 3):
+        return f"séquence {seq} et {replayed} enregistrement(s) rejoué(s) au lieu de 3 et 3"
+    if state(index) != {('séries', "Dark"): {'nom': "Dark", 'statut': 'en cours', 'saison': 1, 'episode': 3}}:
+        return f"données rejouées inattendues : {state(index)}"
+
+    # La reprise intègre le journal à l'instantané : les ajouts suivants ne suivent pas la ligne coupée
+    storage = JournalStorage(UserDataCache())
+    storage.recover()
+    if os.path.exists(journal_path(USER_ID)):
+        return "journal toujours présent après la reprise"
+    asyncio.run(storage.insert(USER_ID, 'films', {'nom': "Heat", 'statut': 'terminé'}))
+    storage.close()
+    index, seq, _ = read_journal(USER_ID)
+    if seq != 4 or ('films', "Heat") not in state(index):
+        return f"ajout après la reprise perdu (séquence {seq}, données {state(index)})"
+    return stats_violation(index)
+
+def check_snapshot_sequence():
+    """Seuls les enregistrements postérieurs au `journal_seq` de l'instantané sont rejoués."""
+    index = index_user_data(empty_user_data())
+    index['séries']['dark'] = entry("Dark", 'terminé')
+    index.stats = UserStats.from_index(index)
+    write_snapshot(USER_ID, index, 2)
+    # Journal d'avant l'instantané, resté sur disque : l'enregistrement 1 ne doit pas annuler le statut terminé
+    append_journal(USER_ID, records_lines([('put', 'séries', entry("Dark", 'en cours', saison=1, episode=1))]))
+    append_journal(USER_ID, records_lines([('put', 'films', entry("Heat", 'prévu'))], first_seq=3))
+
+    index, seq, replayed = read_journal(USER_ID)
+    if (seq, replayed) != (3, 1):
+        return f"séquence {seq} et {replayed} enregistrement(s) rejoué(s) au lieu de 3 et 1"
+    expected = {
+        ('séries', "Dark"): {'nom': "Dark", 'statut': 'terminé'},
+        ('films', "Heat"): {'nom': "Heat", 'statut': 'prévu'},
+    }
+    if state(index) != expected:
+        return f"données rejouées inattendues : {state(index)}"
+    return stats_violation(index)
+
+def check_crash_after_rename():
+    """Arrêt entre le renommage de l'instantané et la suppression du journal : rien n'est rejoué deux fois."""
+    storage = JournalStorage(UserDataCache(), compact_records=1000)
+
+    async def modify():
+        await storage.insert(USER_ID, 'séries', {'nom': "Dark", 'statut': 'en cours', 'saison': 1, 'episode': 1})
+        for episode in range(2, 6):
+            await storage.replace(USER_ID, 'séries', {'nom': "Dark", 'statut': 'en cours', 'saison': 1, 'episode': episode})
+        await storage.insert(USER_ID, 'films', {'nom': "Alien", 'statut': 'prévu'})
+        await storage.delete(USER_ID, 'films', "Alien")
+    # Pas de `close`, qui compacterait le journal : le processus s'arrête brutalement
+    asyncio.run(modify())
+
+    # État laissé par l'arrêt : nouvel instantané en place, ancien journal encore présent
+    log = journal_path(USER_ID)
+    index, seq, _ = read_journal(USER_ID)
+    shutil.copyfile(log, f"{log}.copy")
+    write_snapshot(USER_ID, index, seq)
+    os.replace(f"{log}.copy", log)
+    expected = state(index)
+
+    index, seq_after, replayed = read_journal(USER_ID)
+    if replayed or seq_after != seq:
+        return f"{replayed} enregistrement(s) déjà intégré(s) rejoué(s), séquence {seq_after} au lieu de {seq}"
+    if state(index) != expected:
+        return f"données relues inattendues : {state(index)}"
+
+    # Au redémarrage : les nouveaux enregistrements suivent la séquence de l'instantané, puis la reprise compacte
+    storage = JournalStorage(UserDataCache(), compact_records=1000)
+    asyncio.run(storage.replace(USER_ID, 'séries', {'nom': "Dark", 'statut': 'en cours', 'saison': 1, 'episode': 6}))
+    index, seq_after, _ = read_journal(USER_ID)
+    if seq_after != seq + 1 or index['séries']['dark'].episode != 6:
+        return f"modification après redémarrage perdue (séquence {seq_after}, épisode {index['séries']['dark'].episode})"
+    JournalStorage(UserDataCache()).recover()
+    if os.path.exists(log):
+        return "journal toujours présent après la reprise"
+    return stats_violation(read_journal(USER_ID)[0])
+
+def check_foreign_log():
+    """Un fichier `.log` qui n'est pas le journal d'un utilisateur n'empêche pas la reprise."""
+    with open(os.path.join(DATA_DIR, "watchtrack.log"), "w") as file:
+        file.write("journal de l'exploitant\n")
+    append_journal(USER_ID, records_lines([('put', 'films', entry("Alien", 'prévu'))]))
+    recovered = JournalStorage(UserDataCache()).recover()
+    if recovered != 1:
+        return f"{recovered} modification(s) récupérée(s) au lieu de 1"
+    return None
+
+CHECKS = [check_truncated_record, check_snapshot_sequence, check_crash_after_rename, check_foreign_log]
+
+def run_check(check):
+    """Exécute une vérification dans un répertoire de données vide ; retourne l'échec ou None."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="watchtrack-journal-") as temporary:
+        os.chdir(temporary)
+        try:
+            os.makedirs(DATA_DIR)
+            return check()
+        finally:
+            os.chdir(previous)
+
+def main():
+    failures = 0
+    for check in CHECKS:
+        failure = run_check(check)
+        print(f"{check.__name__:<28} {'ok' if failure is None else 'ÉCHEC : ' + failure}")
+        failures += failure is not None
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
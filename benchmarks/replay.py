@@ -0,0 +1,396 @@
+"""Rejeu de charge hors ligne : des centaines de commandes simultanées, puis vérification des données.
+
+Une trace (générée, ou enregistrée par le bot avec TRACE_PATH) est rejouée
+sur les commandes slash au rythme de ses instants, avec au plus
+`--concurrency` commandes en cours. Sont relevés la latence de réponse (file
+d'attente comprise) et de traitement par commande, le retard de la boucle
+d'événements, puis, une fois le stockage fermé, les incohérences des données
+relues sur disque : incréments ou ajouts perdus, suppressions annulées,
+doublons, statistiques et index global des titres divergents.
+
+    python -m benchmarks.replay --users 20 --events 5000 --rate 500 --concurrency 200
+    python -m benchmarks.replay --trace commandes.jsonl --data user_data --speed 10
+
+La sortie est non nulle si une commande a échoué ou si une incohérence est détectée.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+from benchmarks.bench import fresh_storage, percentile
+from benchmarks.fakes import application_commands, invoke, load_bot
+from benchmarks.synthetic import WORDS, generate_library
+from command_trace import UNREPLAYABLE_COMMANDS, read_trace, write_trace
+from media import CATEGORIES, STATUSES, STATUS_BY_CODE, normalize_name
+from stats import UserStats
+
+# Utilisateurs et serveurs fictifs des traces générées
+BASE_USER_ID = 20_000_000
+GUILDS = 3
+TYPES = ['film', 'série', 'manga', 'anime']
+
+# Fréquence relative des commandes dans une trace générée
+COMMAND_WEIGHTS = {
+    'add': 20, 'edit': 15, 'delete': 3, 'next': 25, 'list': 8, 'filter': 5,
+    'search': 8, 'stats': 5, 'watchers': 4, 'top': 3, 'export': 4,
+}
+
+# Intervalle de mesure du retard de la boucle d'événements, en secondes
+LAG_INTERVAL = 0.01
+
+# Incohérences détaillées dans le rapport, au plus
+MAX_VIOLATIONS_SHOWN = 20
+
+def counter_name(k):
+    return f"Compteur {k}"
+
+def target_name(k):
+    return f"Cible {k}"
+
+def deletion_name(k):
+    return f"Suppression {k}"
+
+def setup_entries(targets):
+    """Médias visés par les modifications d'une trace générée : /next, /edit et suppressions."""
+    entries = []
+    for k in range(targets):
+        entries.append(('séries', {'nom': counter_name(k), 'statut': 'en cours', 'saison': 1, 'episode': 0}))
+        entries.append(('animes', {'nom': target_name(k), 'statut': 'prévu'}))
+        entries.append(('films', {'nom': deletion_name(k), 'statut': 'prévu'}))
+    return entries
+
+def generate_events(users, events, rate, targets, seed=0):
+    """Génère une trace : arrivées de Poisson à `rate` commandes par seconde (toutes à l'instant 0 si nul).
+
+    Les modifications visent un petit nombre de médias par utilisateur pour
+    provoquer des commandes simultanées sur les mêmes données.
+    """
+    rng = random.Random(seed)
+    kinds = list(COMMAND_WEIGHTS)
+    weights = list(COMMAND_WEIGHTS.values())
+    t = 0.0
+    trace = []
+    for i in range(events):
+        if rate:
+            t += rng.expovariate(rate)
+        user = BASE_USER_ID + rng.randrange(users)
+        kind = rng.choices(kinds, weights)[0]
+        k = rng.randrange(targets)
+        command = kind
+        if kind == 'add':
+            options = {'type': rng.choice(TYPES), 'nom': f"Ajout {i}", 'statut': rng.choice(STATUSES)}
+        elif kind == 'edit':
+            options = {'type': 'anime', 'nom': target_name(k), 'action': 'éditer', 'statut': rng.choice(STATUSES)}
+            if options['statut'] == 'en cours':
+                options.update(saison=rng.randint(1, 5), episode=rng.randint(1, 24))
+        elif kind == 'delete':
+            command = 'edit'
+            options = {'type': 'film', 'nom': deletion_name(k), 'action': 'supprimer', 'statut': 'terminé'}
+        elif kind == 'next':
+            options = {'type': 'série', 'nom': counter_name(k)}
+        elif kind == 'list':
+            options = {'order': rng.choice(['asc', 'desc'])}
+        elif kind == 'filter':
+            options = {'media_type': rng.choice(TYPES), 'order': 'asc', 'statut': rng.choice(STATUSES)}
+        elif kind == 'search':
+            options = {'recherche': rng.choice(WORDS)}
+        elif kind == 'watchers':
+            options = {'nom': counter_name(k)}
+        elif kind == 'export':
+            options = {'export_format': rng.choice(['txt', 'csv', 'json'])}
+        else:
+            options = {}
+        trace.append({
+            't': round(t, 4),
+            'user': user,
+            'guild': 1 + (user - BASE_USER_ID) % GUILDS,
+            'command': command,
+            'options': options,
+        })
+    return trace
+
+async def prepare(storage, setup):
+    """Crée les bibliothèques décrites par l'en-tête d'une trace générée."""
+    for u in range(setup['users']):
+        entries = generate_library(setup['library'], setup['seed'] + u) + setup_entries(setup['targets'])
+        await storage.insert_many(BASE_USER_ID + u, entries)
+    await storage.flush()
+
+def modifications(events):
+    """Regroupe les modifications de la trace par média : {(user_id, catégorie, nom normalisé): opérations}."""
+    media_ops = {}
+    for event in events:
+        command, options = event['command'], event['options']
+        if command not in ('add', 'edit', 'next') or not options.get('nom') or not options.get('type'):
+            continue
+        key = (event['user'], options['type'] + 's', normalize_name(options['nom']))
+        ops = media_ops.setdefault(key, {'add': 0, 'edit': 0, 'delete': 0, 'next': Counter(), 'statuts': set()})
+        if command == 'add':
+            ops['add'] += 1
+        elif command == 'next':
+            # Refusé pour un film, ou par chapitre hors des mangas : sans effet
+            if options['type'] != 'film' and (options.get('unite') != 'chapitre' or options['type'] == 'manga'):
+                ops['next'][options.get('unite') or ('chapitre' if options['type'] == 'manga' else 'episode')] += 1
+        elif options.get('action') == 'supprimer':
+            ops['delete'] += 1
+        else:
+            ops['edit'] += 1
+            ops['statuts'].add(options.get('statut'))
+    return media_ops
+
+def check_media(ops, before, after):
+    """Compare l'état final d'un média aux modifications rejouées.
+
+    Retourne (vérifiable, incohérence ou None). Seules les modifications d'un
+    même genre ont un résultat indépendant de l'ordre d'exécution.
+    """
+    kinds = {kind for kind in ('add', 'edit', 'delete', 'next') if ops[kind]}
+    if kinds == {'add'}:
+        return True, None if after is not None else "ajouté mais absent"
+    if kinds == {'delete'}:
+        return True, None if after is None else "supprimé mais toujours présent"
+    if kinds == {'next'}:
+        if before is None:
+            return True, None if after is None else "apparu sans /add"
+        if after is None:
+            return True, "disparu après /next"
+        for field, count in ops['next'].items():
+            # /next n'avance que les médias en cours
+            expected = (before.get(field) or 0) + (count if before['statut'] == 'en cours' else 0)
+            if (after.get(field) or 0) != expected:
+                return True, f"{field} = {after.get(field) or 0} au lieu de {expected} (incréments perdus)"
+        return True, None
+    if kinds == {'edit'}:
+        if (before is None) != (after is None):
+            return True, "présence modifiée par /edit"
+        if after is not None and after['statut'] not in ops['statuts'] | {before['statut']}:
+            return True, f"statut « {after['statut']} » jamais écrit"
+        return True, None
+    return False, None
+
+async def check_user(storage, user_id):
+    """Vérifie les données d'un utilisateur : doublons et statistiques enregistrées.
+
+    Retourne (incohérences, titres [(user_id, catégorie, nom normalisé, nom, statut)]).
+    """
+    violations = []
+    titles = []
+    stats = UserStats()
+    for category in CATEGORIES:
+        keys = set()
+        for media in await storage.query(user_id, category):
+            key = normalize_name(media['nom'])
+            if key in keys:
+                violations.append(f"{user_id} : {media['nom']} en double dans {category}")
+            keys.add(key)
+            stats.add(category, media)
+            titles.append((user_id, category, key, media['nom'], media['statut']))
+    saved = await storage.user_stats(user_id)
+    if saved != stats:
+        violations.append(f"{user_id} : statistiques enregistrées {saved!r} au lieu de {stats!r}")
+    return violations, titles
+
+def title_index_violations(title_index, titles, user_ids):
+    """Compare l'index global tenu pendant le rejeu aux titres relus sur disque."""
+    indexed = {}
+    for category, category_titles in json.loads(title_index.encode())['titles'].items():
+        for key, (nom, users) in category_titles.items():
+            for user_id, code in users.items():
+                if int(user_id) in user_ids:
+                    indexed[(int(user_id), category, key)] = STATUS_BY_CODE[code].value
+    expected = {(user_id, category, key): statut for user_id, category, key, nom, statut in titles}
+    violations = []
+    for doc in sorted(expected.keys() | indexed.keys()):
+        if expected.get(doc) != indexed.get(doc):
+            violations.append(f"index des titres : {doc} vaut {indexed.get(doc)} au lieu de {expected.get(doc)}")
+    return violations
+
+async def monitor_lag(samples):
+    """Mesure en continu le retard de réveil de la boucle d'événements."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - expected))
+
+async def replay(bot, events, concurrency, speed):
+    """Rejoue les événements à leurs instants ; retourne ([(commande, réponse, traitement, erreur)], durée)."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def run(event, scheduled):
+        async with semaphore:
+            started = loop.time()
+            error = None
+            try:
+                await invoke(bot, event['command'], event['user'], event.get('guild'), **event['options'])
+            except Exception as exception:
+                error = f"{type(exception).__name__}: {exception}"
+            finished = loop.time()
+        results.append((event['command'], finished - scheduled, finished - started, error))
+
+    origin = events[0]['t'] if events else 0
+    start = loop.time()
+    tasks = []
+    for event in events:
+        scheduled = start + (event['t'] - origin) / speed
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run(event, scheduled)))
+    await asyncio.gather(*tasks)
+    return results, loop.time() - start
+
+def latency_summary(values):
+    values = [value * 1000 for value in values]
+    return {
+        'p50_ms': round(percentile(values, 0.5), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+        'max_ms': round(max(values), 3),
+    }
+
+def summarize(results, duration, lag_samples, skipped):
+    by_command = defaultdict(list)
+    for result in results:
+        by_command[result[0]].append(result)
+    report = {
+        'commands': len(results),
+        'skipped': skipped,
+        'duration_s': round(duration, 3),
+        'throughput': round(len(results) / duration, 1) if duration else None,
+        'errors': [error for _, _, _, error in results if error],
+        'latency': {},
+        'loop_lag': latency_summary(lag_samples or [0.0]),
+    }
+    for command, command_results in sorted(by_command.items()) + [("total", results)]:
+        if not command_results:
+            continue
+        report['latency'][command] = {
+            'count': len(command_results),
+            'response': latency_summary([response for _, response, _, _ in command_results]),
+            'service': latency_summary([service for _, _, service, _ in command_results]),
+            'errors': sum(1 for *_, error in command_results if error),
+        }
+    return report
+
+def print_report(report):
+    print(f"\n{report['commands']} commandes rejouées en {report['duration_s']} s "
+          f"({report['throughput']}/s), {report['skipped']} ignorée(s)")
+    print(f"{'commande':<10}{'nombre':>8}{'p50':>10}{'p99':>10}{'max':>10}{'trait. p50':>12}{'trait. p99':>12}{'erreurs':>9}")
+    for command, latency in report['latency'].items():
+        response, service = latency['response'], latency['service']
+        print(f"{command:<10}{latency['count']:>8}{response['p50_ms']:>10.2f}{response['p99_ms']:>10.2f}"
+              f"{response['max_ms']:>10.2f}{service['p50_ms']:>12.2f}{service['p99_ms']:>12.2f}{latency['errors']:>9}")
+    lag = report['loop_lag']
+    print(f"Retard de la boucle : p50 {lag['p50_ms']:.2f} ms, p99 {lag['p99_ms']:.2f} ms, max {lag['max_ms']:.2f} ms")
+    consistency = report['consistency']
+    print(f"Cohérence : {consistency['checked']} média(s) vérifié(s), {consistency['unchecked']} non vérifiable(s), "
+          f"{len(consistency['violations'])} incohérence(s)")
+    for violation in consistency['violations'][:MAX_VIOLATIONS_SHOWN]:
+        print(f"  - {violation}")
+    for error in report['errors'][:MAX_VIOLATIONS_SHOWN]:
+        print(f"  ! {error}")
+
+async def run(args, setup, events):
+    bot = load_bot(args.backend)
+    verify = None
+    try:
+        if setup is not None:
+            await prepare(bot.storage, setup)
+        bot.load_title_index()
+
+        commands = application_commands(bot)
+        replayable = [event for event in events if event['command'] in commands and event['command'] not in UNREPLAYABLE_COMMANDS]
+        media_ops = modifications(replayable)
+        before = {key: await bot.storage.find(*key) for key in media_ops}
+
+        lag_samples = []
+        monitor = asyncio.create_task(monitor_lag(lag_samples))
+        try:
+            results, duration = await replay(bot, replayable, args.concurrency, args.speed)
+        finally:
+            monitor.cancel()
+        report = summarize(results, duration, lag_samples, len(events) - len(replayable))
+
+        # Les données sont relues sur disque par une instance neuve, une fois tout écrit
+        await bot.progress.settle_all()
+        bot.storage.close()
+        verify = fresh_storage(bot)
+        violations = []
+        checked = 0
+        for key, ops in media_ops.items():
+            verifiable, violation = check_media(ops, before[key], await verify.find(*key))
+            checked += verifiable
+            if violation:
+                violations.append(f"{key[0]} : {key[1]}/{key[2]} {violation}")
+        user_ids = {event['user'] for event in replayable}
+        titles = []
+        for user_id in sorted(user_ids):
+            user_violations, user_titles = await check_user(verify, user_id)
+            violations.extend(user_violations)
+            titles.extend(user_titles)
+        violations.extend(title_index_violations(bot.title_index, titles, user_ids))
+        report['consistency'] = {'checked': checked, 'unchecked': len(media_ops) - checked, 'violations': violations}
+        return report
+    finally:
+        if verify is not None:
+            verify.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu de charge hors ligne des commandes de Watchtrack")
+    parser.add_argument("--backend", choices=["json", "journal", "sqlite"], default="json")
+    parser.add_argument("--trace", help="Trace à rejouer (générée sinon)")
+    parser.add_argument("--save-trace", help="Enregistre la trace générée dans ce fichier")
+    parser.add_argument("--data", help="Répertoire user_data ou base SQLite copiés avant le rejeu")
+    parser.add_argument("--users", type=int, default=20, help="Utilisateurs de la trace générée")
+    parser.add_argument("--events", type=int, default=2000, help="Commandes de la trace générée")
+    parser.add_argument("--rate", type=float, default=200, help="Commandes par seconde de la trace générée (0 = toutes d'un coup)")
+    parser.add_argument("--library", type=int, default=200, help="Médias générés par utilisateur")
+    parser.add_argument("--targets", type=int, default=5, help="Médias visés par les modifications, par utilisateur")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=100, help="Commandes en cours au plus")
+    parser.add_argument("--speed", type=float, default=1.0, help="Facteur d'accélération de la trace")
+    parser.add_argument("--output", help="Enregistre le rapport en JSON")
+    parser.add_argument("--workdir", help="Répertoire des données rejouées (temporaire par défaut)")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        setup, events = read_trace(args.trace)
+    else:
+        setup = {'users': args.users, 'library': args.library, 'targets': args.targets, 'seed': args.seed}
+        events = generate_events(args.users, args.events, args.rate, args.targets, args.seed)
+        if args.save_trace:
+            write_trace(args.save_trace, events, setup)
+    output = os.path.abspath(args.output) if args.output else None
+    data = os.path.abspath(args.data) if args.data else None
+    # Le rejeu ne doit pas lui-même enregistrer de trace
+    os.environ.pop("TRACE_PATH", None)
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="watchtrack-replay-") as temporary:
+        os.chdir(args.workdir or temporary)
+        try:
+            if data and os.path.isdir(data):
+                shutil.copytree(data, "user_data", dirs_exist_ok=True)
+            elif data:
+                shutil.copyfile(data, os.environ.get("SQLITE_PATH", "watchtrack.db"))
+            report = asyncio.run(run(args, setup, events))
+        finally:
+            os.chdir(previous)
+
+    print_report(report)
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+    return 1 if report['errors'] or report['consistency']['violations'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
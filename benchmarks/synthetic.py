@@ -0,0 +1,36 @@
+"""Bibliothèques de médias synthétiques, reproductibles à partir d'une graine."""
+import random
+
+from media import CATEGORIES, STATUSES
+
+WORDS = [
+    "dragon", "ombre", "étoile", "cité", "guerrier", "fantôme", "océan", "lune", "chevalier", "forêt",
+    "samouraï", "empire", "voyage", "secret", "tempête", "légende", "pirate", "neige", "cœur", "éclipse",
+    "academy", "hunter", "shadow", "galaxy", "blade", "quest", "spirit", "titan", "garden", "signal",
+    "mystère", "lumière", "royaume", "printemps", "abysse", "mémoire", "horizon", "démon", "requiem", "miroir",
+]
+
+def generate_library(size, seed=0):
+    """Retourne `size` couples (catégorie, média) aux noms uniques, répartis sur toutes les catégories."""
+    rng = random.Random(seed)
+    library = []
+    for i in range(size):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        statut = rng.choice(STATUSES)
+        entry = {'nom': f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()} {i}", 'statut': statut}
+        if statut == 'en cours':
+            if category == 'mangas':
+                entry['volume'] = rng.randint(1, 40)
+                entry['chapitre'] = rng.randint(1, 400)
+            elif category != 'films':
+                entry['saison'] = rng.randint(1, 8)
+                entry['episode'] = rng.randint(1, 24)
+        library.append((category, entry))
+    return library
+
+async def populate(storage, user_id, size, seed=0):
+    """Remplit la liste d'un utilisateur et l'écrit sur disque ; retourne la bibliothèque générée."""
+    library = generate_library(size, seed)
+    await storage.insert_many(user_id, library)
+    await storage.flush()
+    return library
@@ -1,38 +1,165 @@
+import asyncio
+import sys
+import time
 import nextcord
-from nextcord.ext import commands
+from aiohttp import web
+from nextcord.ext import commands, tasks
 from nextcord import SlashOption
-import json
 import os
 from dotenv import load_dotenv
+from cache import UserDataCache
+from command_trace import TraceRecorder
+from export import build_export, parse_import
+from index_cache import IndexCache
+from journal import JournalStorage
+from metrics import metrics
+from prefix_index import AutocompleteIndex, PrefixIndex
+from progress import ProgressCoalescer
+from render import RenderCache, format_media_details, format_media_line
+from search_index import SearchEngine, TrigramIndex
+from views import MediaCursor, MediaPaginator
+from media import CATEGORIES, STATUSES, capitalize_name
+from sqlite_storage import SqliteStorage
+from storage import DATA_DIR, JsonStorage
+from title_index import TitleIndex, scan_user_files
 
 load_dotenv()  # Charger les variables d'environnement depuis le fichier .env
 
 TOKEN = os.getenv("DISCORD_TOKEN")  # Obtenez le token depuis les variables d'environnement
 
-intents = nextcord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Les commandes slash n'ont besoin que des serveurs : ni membres, ni présences, ni messages
+intents = nextcord.Intents.none()
+intents.guilds = True
 
-# Répertoire pour stocker les fichiers utilisateur
-DATA_DIR = "user_data"
+# Mode réparti (lancé par shards.py) : ce processus ne gère que les shards SHARD_IDS parmi SHARD_COUNT
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()] or None
+SHARD_WORKER = int(os.getenv("SHARD_WORKER", "0"))
+
+
+class WatchtrackBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def close(self):
+        # Écrit la progression en attente de /next tant que la boucle tourne encore
+        await progress.settle_all()
+        await super().close()
+
+
+if SHARD_COUNT:
+    # Seul le processus du shard 0 enregistre les commandes auprès de Discord ; les autres les associent
+    owns_commands = SHARD_IDS is None or 0 in SHARD_IDS
+    bot = WatchtrackBot(
+        intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS,
+        rollout_delete_unknown=owns_commands, rollout_register_new=owns_commands, rollout_update_known=owns_commands
+    )
+else:
+    bot = WatchtrackBot(intents=intents)
+
+# Stockage des données : "json" (un fichier par utilisateur), "journal" (JSON journalisé) ou "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+if SHARD_COUNT and STORAGE_BACKEND != "sqlite":
+    # Les caches des stockages par fichier ne sont pas partagés entre processus
+    sys.exit("Le mode réparti nécessite STORAGE_BACKEND=sqlite")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "watchtrack.db")
+# Nombre d'enregistrements du journal au-delà duquel il est intégré à l'instantané
+JOURNAL_COMPACT_RECORDS = int(os.getenv("JOURNAL_COMPACT_RECORDS", "100"))
+
+# Limites du cache des données utilisateur et intervalle d'écriture différée (en secondes)
+CACHE_MAX_USERS = int(os.getenv("CACHE_MAX_USERS", "256"))
+CACHE_MAX_MEDIAS = int(os.getenv("CACHE_MAX_MEDIAS", "0")) or None
+CACHE_FLUSH_INTERVAL = float(os.getenv("CACHE_FLUSH_INTERVAL", "30"))
+
+# Point d'accès HTTP local des métriques au format Prometheus (0 = désactivé)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+if METRICS_PORT:
+    # En mode réparti, un port par processus à partir de METRICS_PORT
+    METRICS_PORT += SHARD_WORKER
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Délai sans nouvel incrément de /next avant l'écriture, et délai maximal (en secondes)
+# En mode réparti, les autres processus ne voient pas les incréments en attente : écriture immédiate par défaut
+PROGRESS_DEBOUNCE = float(os.getenv("PROGRESS_DEBOUNCE", "0" if SHARD_COUNT else "5"))
+PROGRESS_MAX_DELAY = float(os.getenv("PROGRESS_MAX_DELAY", "60"))
 
 # Crée le répertoire s'il n'existe pas déjà
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
-def load_user_data(user_id):
-    """Charge les données de l'utilisateur à partir d'un fichier JSON."""
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r") as file:
-            return json.load(file)
-    else:
-        return {'films': [], 'séries': [], 'mangas': [], 'animes': []}
+# Intervalle de relecture des modifications des autres processus, et durée de leur conservation (en secondes)
+STORAGE_SYNC_INTERVAL = float(os.getenv("STORAGE_SYNC_INTERVAL", "1"))
+STORAGE_CHANGES_RETENTION = 600
 
-def save_user_data(user_id, data):
-    """Sauvegarde les données de l'utilisateur dans un fichier JSON."""
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    with open(file_path, "w") as file:
-        json.dump(data, file, indent=4)
+if STORAGE_BACKEND == "sqlite":
+    storage = SqliteStorage(SQLITE_PATH, origin=os.getpid() if SHARD_COUNT else None)
+elif STORAGE_BACKEND == "journal":
+    storage = JournalStorage(
+        UserDataCache(max_users=CACHE_MAX_USERS, max_medias=CACHE_MAX_MEDIAS),
+        compact_records=JOURNAL_COMPACT_RECORDS
+    )
+    # Rejoue les journaux laissés par un arrêt brutal
+    print(f"Journal : {storage.recover()} modification(s) récupérée(s)")
+else:
+    storage = JsonStorage(UserDataCache(max_users=CACHE_MAX_USERS, max_medias=CACHE_MAX_MEDIAS))
+
+# Nombre de médias au-delà duquel /export diffère sa réponse
+EXPORT_DEFER_THRESHOLD = 500
+
+# Taille maximale d'un fichier importé, et nombre de rejets détaillés dans la réponse
+IMPORT_MAX_SIZE = 1024 * 1024
+IMPORT_MAX_REJECTED_SHOWN = 10
+
+# Lignes mises en forme de /list et /filter
+render_cache = RenderCache(storage, max_users=CACHE_MAX_USERS)
+
+# Index par utilisateur de l'autocomplétion et de /search, construits à partir d'une même lecture ;
+# celui des préfixes d'abord, bien plus rapide à construire
+user_indexes = IndexCache(storage, [PrefixIndex, TrigramIndex], max_users=CACHE_MAX_USERS)
+
+# Recherche approchée de /search
+SEARCH_MAX_RESULTS = 25
+search_engine = SearchEngine(user_indexes)
+
+# Autocomplétion des noms par préfixe (25 suggestions au plus, 100 caractères par nom)
+AUTOCOMPLETE_MAX_CHOICES = 25
+autocomplete_index = AutocompleteIndex(user_indexes)
+
+# Incréments de /next regroupés avant écriture
+progress = ProgressCoalescer(storage, delay=PROGRESS_DEBOUNCE, max_delay=PROGRESS_MAX_DELAY)
+
+# Index global des titres pour les commandes de serveur, reconstruit par un pool de processus
+TITLE_INDEX_WORKERS = int(os.getenv("TITLE_INDEX_WORKERS", "0")) or None
+TOP_MAX_TITLES = 10
+if SHARD_COUNT:
+    # Chaque processus garde les membres des serveurs de ses shards dans son propre fichier
+    title_index = TitleIndex(os.path.join(DATA_DIR, f"titles_index.shards-{min(SHARD_IDS or [0])}-{max(SHARD_IDS or [SHARD_COUNT - 1])}.json"))
+else:
+    title_index = TitleIndex()
+storage.add_listener(title_index.on_change)
+
+def load_title_index():
+    """Charge l'index global des titres, ou le reconstruit à partir des données."""
+    if STORAGE_BACKEND == "sqlite":
+        # Une seule requête suffit : l'index enregistré ne sert qu'à garder les serveurs
+        title_index.load()
+        title_index.rebuild(storage.scan_titles())
+    elif not title_index.load():
+        title_index.rebuild(scan_user_files(workers=TITLE_INDEX_WORKERS))
+        print(f"Index des titres reconstruit : {len(title_index)} titres")
+
+@tasks.loop(seconds=CACHE_FLUSH_INTERVAL)
+async def flush_user_cache():
+    """Écrit périodiquement sur disque les données modifiées du cache."""
+    await storage.flush()
+    if SHARD_COUNT:
+        await storage.prune_changes(STORAGE_CHANGES_RETENTION)
+    if title_index.dirty:
+        # Seul l'instantané, une copie sur écriture, est pris sur la boucle : la sérialisation se fait dans un thread
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, title_index.save, title_index.snapshot())
+
+@tasks.loop(seconds=STORAGE_SYNC_INTERVAL)
+async def sync_storage():
+    """Répercute sur les caches et les index les modifications des autres processus (mode réparti)."""
+    await storage.sync()
 
 def get_color(type):
     """Retourne la couleur de l'embed en fonction du type de média."""
@@ -44,18 +171,92 @@ def get_color(type):
     }
     return colors.get(type, nextcord.Color.default())
 
-def normalize_name(name):
-    """Convertit le nom en minuscules pour la normalisation."""
-    return name.lower()
-
-def capitalize_name(name):
-    """Met en majuscule la première lettre de chaque mot dans le nom."""
-    return ' '.join(word.capitalize() for word in name.split())
+async def suggest_names(user_id, text, category=None):
+    """Retourne les noms suggérés pendant la saisie : préfixes d'abord, puis correspondances approchées."""
+    names = await autocomplete_index.complete(user_id, text, category, AUTOCOMPLETE_MAX_CHOICES)
+    if len(names) < AUTOCOMPLETE_MAX_CHOICES and len(text) >= 3:
+        # Sans attendre l'index de trigrammes, dont la construction dépasserait le délai de 3 s de Discord
+        for media_type, media in search_engine.search_ready(user_id, text, AUTOCOMPLETE_MAX_CHOICES) or []:
+            if (category is None or media_type == category) and media['nom'] not in names:
+                names.append(media['nom'])
+    # Discord refuse les suggestions de plus de 100 caractères
+    return [name for name in names if len(name) <= 100][:AUTOCOMPLETE_MAX_CHOICES]
 
 @bot.event
 async def on_ready():
+    if not flush_user_cache.is_running():
+        flush_user_cache.start()
+    if SHARD_COUNT and not sync_storage.is_running():
+        sync_storage.start()
+    if METRICS_PORT and metrics_server is None:
+        await start_metrics_server()
     print(f'{bot.user} a démarré avec succès !')
 
+def update_metrics_gauges():
+    """Recopie dans les métriques les compteurs des caches et du stockage."""
+    for stat, value in storage.stats().items():
+        metrics.set("watchtrack_storage_stat", value, stat=stat)
+    metrics.set("watchtrack_render_cache_total", render_cache.hits, result="hit")
+    metrics.set("watchtrack_render_cache_total", render_cache.misses, result="miss")
+    metrics.set("watchtrack_progress_total", progress.increments, kind="increments")
+    metrics.set("watchtrack_progress_total", progress.writes, kind="writes")
+    metrics.set("watchtrack_title_index_titles", len(title_index))
+
+metrics_server = None
+
+async def start_metrics_server():
+    """Démarre le point d'accès HTTP /metrics, sur l'interface locale par défaut."""
+    global metrics_server
+
+    async def handle_metrics(request):
+        update_metrics_gauges()
+        return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    metrics_server = web.AppRunner(app)
+    await metrics_server.setup()
+    await web.TCPSite(metrics_server, METRICS_HOST, METRICS_PORT).start()
+    print(f"Métriques disponibles sur http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# Début de chaque commande en cours, pour mesurer sa durée
+command_started = {}
+
+# Enregistrement facultatif des commandes reçues, rejouables par benchmarks/replay.py
+TRACE_PATH = os.getenv("TRACE_PATH")
+trace_recorder = TraceRecorder(TRACE_PATH) if TRACE_PATH else None
+
+@bot.listen("on_interaction")
+async def track_guild_member(interaction: nextcord.Interaction):
+    # Les membres d'un serveur sont connus par leurs interactions, sans intent privilégié
+    if interaction.guild_id is not None and interaction.user is not None:
+        title_index.add_member(interaction.guild_id, interaction.user.id)
+
+@bot.application_command_before_invoke
+async def before_application_command(interaction: nextcord.Interaction):
+    command_started[interaction.id] = time.perf_counter()
+    if trace_recorder is not None:
+        trace_recorder.record(interaction)
+    # Les modifications faites depuis un autre processus sont visibles avant la commande
+    await storage.sync()
+    # Les autres commandes voient la progression de /next déjà écrite
+    command = interaction.application_command
+    if command is not None and command.name != "next" and progress.pending(interaction.user.id):
+        await progress.settle(interaction.user.id)
+
+@bot.application_command_after_invoke
+async def after_application_command(interaction: nextcord.Interaction):
+    # Appelé aussi quand la commande a levé une exception
+    started = command_started.pop(interaction.id, None)
+    if started is not None:
+        metrics.observe("watchtrack_command_seconds", time.perf_counter() - started, command=interaction.application_command.name)
+
+@bot.listen("on_application_command_error")
+async def count_command_error(interaction: nextcord.Interaction, error: Exception):
+    command = interaction.application_command
+    # Compte seulement : le gestionnaire par défaut de nextcord affiche toujours la trace
+    metrics.inc("watchtrack_command_errors_total", command=command.name if command else "inconnue")
+
 @bot.slash_command(description="Ajouter un film, une série, un manga ou un anime")
 async def add(
     interaction: nextcord.Interaction,
@@ -68,17 +269,9 @@ async def add(
     chapitre: int = SlashOption(name="chapitre",required=False,description="Numéro de chapitre (si en cours)")
 ):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
 
-    normalized_nom = normalize_name(nom)
     capitalized_nom = capitalize_name(nom)
 
-    # Vérifie si le média est déjà dans la liste
-    existing_media = [media for media in user_data[type + 's'] if normalize_name(media['nom']) == normalized_nom]
-    if existing_media:
-        await interaction.response.send_message("Ce média est déjà dans votre liste.", ephemeral=True)
-        return
-
     media_entry = {
         'nom': capitalized_nom,
         'statut': statut,
@@ -91,8 +284,10 @@ async def add(
     # Filtrer les valeurs None pour éviter d'afficher des champs non définis
     media_entry = {k: v for k, v in media_entry.items() if v is not None}
 
-    user_data[type + 's'].append(media_entry)
-    save_user_data(user_id, user_data)
+    # L'ajout échoue si le média est déjà dans la liste
+    if not await storage.insert(user_id, type + 's', media_entry):
+        await interaction.response.send_message("Ce média est déjà dans votre liste.", ephemeral=True)
+        return
 
     embed = nextcord.Embed(
         title=f"Ajouté : {capitalized_nom}",
@@ -126,48 +321,47 @@ async def edit(
     chapitre: int = SlashOption(name="chapitre", required=False, description="Numéro du chapitre (si en cours)")
 ):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
 
-    normalized_nom = normalize_name(nom)
     capitalized_nom = capitalize_name(nom)
+    category = type + 's'
 
-    media_list = user_data[type + 's']
-    media_entry = next((media for media in media_list if normalize_name(media.get('nom')) == normalized_nom), None)
+    # Le verrou évite qu'un autre /edit simultané n'écrase cette modification
+    async with storage.lock(user_id):
+        media_entry = await storage.find(user_id, category, nom)
 
-    if action == 'supprimer':
         if media_entry:
-            media_list.remove(media_entry)
-            save_user_data(user_id, user_data)
-            await interaction.response.send_message(f"{capitalized_nom} a été supprimé de votre liste.", ephemeral=True)
-        else:
-            await interaction.response.send_message("Ce média n'est pas dans votre liste.", ephemeral=True)
-        return
+            if action == 'supprimer':
+                await storage.delete(user_id, category, nom)
+            else:
+                # Mise à jour uniquement si la valeur est fournie (non None)
+                if statut is not None:
+                    media_entry['statut'] = statut
+
+                if statut == 'en cours':
+                    if saison is not None:
+                        media_entry['saison'] = saison
+                    if episode is not None:
+                        media_entry['episode'] = episode
+                    if volume is not None:
+                        media_entry['volume'] = volume
+                    if chapitre is not None:
+                        media_entry['chapitre'] = chapitre
+                else:
+                    # Si le statut n'est pas "en cours", on enlève ces informations
+                    media_entry.pop('saison', None)
+                    media_entry.pop('episode', None)
+                    media_entry.pop('volume', None)
+                    media_entry.pop('chapitre', None)
+
+                await storage.replace(user_id, category, media_entry)
 
     if not media_entry:
         await interaction.response.send_message("Ce média n'est pas dans votre liste.", ephemeral=True)
         return
 
-    # Mise à jour uniquement si la valeur est fournie (non None)
-    if statut is not None:
-        media_entry['statut'] = statut
-
-    if statut == 'en cours':
-        if saison is not None:
-            media_entry['saison'] = saison
-        if episode is not None:
-            media_entry['episode'] = episode
-        if volume is not None:
-            media_entry['volume'] = volume
-        if chapitre is not None:
-            media_entry['chapitre'] = chapitre
-    else:
-        # Si le statut n'est pas "en cours", on enlève ces informations
-        media_entry.pop('saison', None)
-        media_entry.pop('episode', None)
-        media_entry.pop('volume', None)
-        media_entry.pop('chapitre', None)
-
-    save_user_data(user_id, user_data)
+    if action == 'supprimer':
+        await interaction.response.send_message(f"{capitalized_nom} a été supprimé de votre liste.", ephemeral=True)
+        return
 
     embed = nextcord.Embed(
         title=f"Modifié : {capitalized_nom}",
@@ -191,69 +385,77 @@ async def edit(
 
 
 
-@bot.slash_command(description="Voir la liste complète de vos films, séries, mangas et animes")
-async def list(
+@edit.on_autocomplete("nom")
+async def edit_nom_autocomplete(interaction: nextcord.Interaction, nom: str, type: str = None):
+    category = type + 's' if type else None
+    await interaction.response.send_autocomplete(await suggest_names(interaction.user.id, nom or "", category))
+
+
+@bot.slash_command(name="next", description="Passer à l'épisode ou au chapitre suivant d'un média")
+async def next_progress(
     interaction: nextcord.Interaction,
-    order: str = SlashOption(name="ordre", choices={"A ➜ Z": "asc", "Z ➜ A": "desc"}, description="Ordre d'affichage des médias")
+    type: str = SlashOption(name="type", choices={"série": "série", "manga": "manga", "anime": "anime"}, description="Le type de média"),
+    nom: str = SlashOption(name="nom", description="Le nom de la série, du manga ou de l'anime"),
+    unite: str = SlashOption(name="unité", choices={"épisode": "episode", "chapitre": "chapitre"}, required=False, description="Ce qui avance d'un cran (chapitre pour un manga, épisode sinon)")
 ):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
+    if type == "film":
+        await interaction.response.send_message("Un film n'a ni épisodes ni chapitres.", ephemeral=True)
+        return
+    if unite == "chapitre" and type != "manga":
+        await interaction.response.send_message("Seuls les mangas avancent par chapitre.", ephemeral=True)
+        return
+    field = unite or ("chapitre" if type == "manga" else "episode")
 
-    if not any(user_data.values()):  # Vérifie s'il y a au moins un média
-        await interaction.response.send_message("Votre liste est vide.", ephemeral=True)
+    # Les incréments rapprochés sont regroupés en une seule écriture
+    media = await progress.increment(user_id, type + 's', nom, field)
+    if media is None:
+        await interaction.response.send_message("Ce média n'est pas dans votre liste.", ephemeral=True)
+        return
+    if media['statut'] != 'en cours':
+        # Comme pour /edit, seul un média en cours a une progression
+        await interaction.response.send_message(
+            f"{media['nom']} n'est pas en cours : passez-le d'abord en cours avec /edit.", ephemeral=True
+        )
         return
 
-    embed = nextcord.Embed(
-        title="Votre Liste",
-        color=nextcord.Color.from_rgb(255, 255, 255)  # Couleur blanche
-    )
+    await interaction.response.send_message(f"{media['nom']}{format_media_details(media)}", ephemeral=True)
+
+@next_progress.on_autocomplete("nom")
+async def next_nom_autocomplete(interaction: nextcord.Interaction, nom: str, type: str = None):
+    category = type + 's' if type else None
+    await interaction.response.send_autocomplete(await suggest_names(interaction.user.id, nom or "", category))
 
-    # Fonction pour formater les détails du média
-    def format_media_details(media):
-        details = []
-        if media.get('saison') is not None:
-            details.append(f"Saison : {media['saison']}")
-        if media.get('episode') is not None:
-            details.append(f"Épisode : {media['episode']}")
-        if media.get('volume') is not None:
-            details.append(f"Volume : {media['volume']}")
-        if media.get('chapitre') is not None:
-            details.append(f"Chapitre : {media['chapitre']}")
-        # Joindre les détails s'ils existent
-        return " - " + ", ".join(details) if details else ""
+
+@bot.slash_command(description="Voir la liste complète de vos films, séries, mangas et animes")
+async def list(
+    interaction: nextcord.Interaction,
+    order: str = SlashOption(name="ordre", choices={"A ➜ Z": "asc", "Z ➜ A": "desc"}, description="Ordre d'affichage des médias")
+):
+    user_id = interaction.user.id
 
     # Déterminer l'ordre de tri
     reverse_order = order == "desc"
 
-    # Fonction pour ajouter des champs sans dépasser la limite de 1024 caractères
-    def add_embed_field(embed, category, statut, filtered_medias):
-        # Séparer les médias si nécessaire
-        chunk = ""
-        for media in filtered_medias:
-            media_text = f"- {media['nom']}{format_media_details(media)}\n"
-            if len(chunk) + len(media_text) > 1024:  # Si ça dépasse la limite
-                embed.add_field(name=f"{category.capitalize()} ({statut.capitalize()})", value=chunk, inline=False)
-                chunk = media_text  # Commence un nouveau bloc
-            else:
-                chunk += media_text
-        if chunk:  # Ajouter le dernier bloc restant
-            embed.add_field(name=f"{category.capitalize()} ({statut.capitalize()})", value=chunk, inline=False)
-
-    # Itérer à travers chaque type de média
+    # Groupes triés par catégorie puis par statut, mis en cache jusqu'à la prochaine modification
+    groups = []
     for category in ['films', 'séries', 'animes', 'mangas']:
-        medias = user_data[category]
-        if medias:
-            for statut in ['en cours', 'terminé', 'prévu']:
-                # Filtrer les médias par statut
-                filtered_medias = [media for media in medias if media['statut'] == statut]
+        for statut in ['en cours', 'terminé', 'prévu']:
+            lines = await render_cache.group_lines(user_id, category, statut, reverse_order)
+            groups.append((f"{category.capitalize()} ({statut.capitalize()})", lines))
+    cursor = MediaCursor(groups)
 
-                # Trier les médias par nom
-                filtered_medias.sort(key=lambda media: media['nom'], reverse=reverse_order)
-
-                if filtered_medias:
-                    add_embed_field(embed, category, statut, filtered_medias)
+    if not cursor.total:  # Vérifie s'il y a au moins un média
+        await interaction.response.send_message("Votre liste est vide.", ephemeral=True)
+        return
 
-    await interaction.response.send_message(embed=embed)
+    view = MediaPaginator(
+        user_id,
+        "Votre Liste",
+        nextcord.Color.from_rgb(255, 255, 255),  # Couleur blanche
+        cursor
+    )
+    await view.send(interaction)
 
 @bot.slash_command(description="Voir les médias par type et statut")
 async def filter(
@@ -263,95 +465,57 @@ async def filter(
     statut: str = SlashOption(name="statut",choices={"en cours": "en cours", "terminé": "terminé", "prévu": "prévu"},description="Statut du média",required=False)
 ):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
 
     # Vérifie que le type de média est valide
     if media_type not in ['film', 'série', 'anime', 'manga']:
         await interaction.response.send_message("Type de média invalide.", ephemeral=True)
         return
 
-    # Initialise l'embed avec le titre correspondant au type de média
-    embed = nextcord.Embed(
-        title=f"{media_type.capitalize()}",
-        color=get_color(media_type)  # Utilise la fonction get_color pour définir la couleur de l'embed
-    )
-
-    # Fonction pour formater les détails du média
-    def format_media_details(media):
-        details = []
-        if media.get('saison') is not None:
-            details.append(f"Saison : {media['saison']}")
-        if media.get('episode') is not None:
-            details.append(f"Épisode : {media['episode']}")
-        if media.get('volume') is not None:
-            details.append(f"Volume : {media['volume']}")
-        if media.get('chapitre') is not None:
-            details.append(f"Chapitre : {media['chapitre']}")
-        # Joindre les détails s'ils existent
-        return " - " + ", ".join(details) if details else ""
-
     # Détermine l'ordre de tri
     reverse_order = order == "desc"
 
     # Si aucun statut n'est spécifié, afficher tous les médias groupés par statut
-    if statut is None:
-        for current_statut in ['en cours', 'terminé', 'prévu']:
-            medias = [media for media in user_data[f"{media_type}s"] if media['statut'] == current_statut]
-
-            # Trier les médias par nom
-            medias.sort(key=lambda media: media['nom'], reverse=reverse_order)
-
-            if medias:
-                field_value = "\n".join(
-                    f"- {media['nom']} {format_media_details(media)}"
-                    for media in medias
-                )
-                embed.add_field(name=current_statut.capitalize(), value=field_value, inline=False)
-    else:
-        # Filtrer les médias par type et statut
-        medias = [media for media in user_data[f"{media_type}s"] if media['statut'] == statut]
-
-        # Trier les médias par nom
-        medias.sort(key=lambda media: media['nom'], reverse=reverse_order)
-
-        if not medias:
+    # (lignes mises en cache jusqu'à la prochaine modification)
+    groups = []
+    for current_statut in ([statut] if statut else ['en cours', 'terminé', 'prévu']):
+        lines = await render_cache.group_lines(user_id, f"{media_type}s", current_statut, reverse_order)
+        groups.append((current_statut.capitalize(), lines))
+    cursor = MediaCursor(groups)
+
+    if not cursor.total:
+        if statut:
             await interaction.response.send_message(f"Aucun {media_type} avec le statut '{statut}' dans votre liste.", ephemeral=True)
-            return
-
-        # Ajouter chaque média à l'embed
-        field_value = "\n".join(
-            f"- {media['nom']}{format_media_details(media)}"
-            for media in medias
-        )
-        embed.add_field(name=statut.capitalize(), value=field_value, inline=False)
+        else:
+            await interaction.response.send_message(f"Aucun {media_type} dans votre liste.", ephemeral=True)
+        return
 
-    await interaction.response.send_message(embed=embed)
+    # Pages avec le titre et la couleur correspondant au type de média
+    view = MediaPaginator(
+        user_id,
+        f"{media_type.capitalize()}",
+        get_color(media_type),
+        cursor
+    )
+    await view.send(interaction)
 
 @bot.slash_command(description="Rechercher un film, une série, un manga ou un anime dans votre liste")
 async def search(
     interaction: nextcord.Interaction,
-    recherche: str = SlashOption(name="recherche", description="Nom ou partie du nom du média à rechercher")
+    recherche: str = SlashOption(name="recherche", description="Nom ou partie du nom du média à rechercher"),
+    limite: int = SlashOption(name="limite", required=False, min_value=1, max_value=SEARCH_MAX_RESULTS, description="Nombre maximal de résultats")
 ):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
-
-    normalized_recherche = normalize_name(recherche)
-    results = {
-        'films': [],
-        'séries': [],
-        'mangas': [],
-        'animes': []
-    }
 
-    # Recherche dans chaque catégorie
-    for media_type in results.keys():
-        results[media_type] = [
-            media for media in user_data[media_type]
-            if normalized_recherche in normalize_name(media['nom'])
-        ]
+    # Recherche approchée dans toutes les catégories, par ordre de pertinence
+    matches = await search_engine.search(user_id, recherche, limite or SEARCH_MAX_RESULTS)
+
+    # Regroupe les résultats par catégorie, en gardant l'ordre de pertinence
+    results = {}
+    for media_type, media in matches:
+        results.setdefault(media_type, []).append(media)
 
     # Si aucun média n'est trouvé
-    if all(len(result) == 0 for result in results.values()):
+    if not results:
         await interaction.response.send_message(f"Aucun média trouvé correspondant à '{recherche}'.", ephemeral=True)
         return
 
@@ -360,93 +524,220 @@ async def search(
         color=nextcord.Color.purple()
     )
 
-    # Fonction pour formater les détails du média
-    def format_media_details(media):
-        details = []
-        if media.get('saison') is not None:
-            details.append(f"Saison : {media['saison']}")
-        if media.get('episode') is not None:
-            details.append(f"Épisode : {media['episode']}")
-        if media.get('volume') is not None:
-            details.append(f"Volume : {media['volume']}")
-        if media.get('chapitre') is not None:
-            details.append(f"Chapitre : {media['chapitre']}")
-        return " - " + ", ".join(details) if details else ""
-
     # Ajoute les résultats à l'embed
     for media_type, media_list in results.items():
-        if media_list:
-            embed.add_field(
-                name=media_type.capitalize(),
-                value="\n".join(
-                    f"- {media['nom']}{format_media_details(media)}" for media in media_list
-                ),
-                inline=False
-            )
+        embed.add_field(
+            name=media_type.capitalize(),
+            value="\n".join(
+                format_media_line(media) for media in media_list
+            ),
+            inline=False
+        )
 
     await interaction.response.send_message(embed=embed)
 
-@bot.slash_command(description="Exporter votre liste de films, séries, mangas et animes, triée par catégorie et statut")
-async def export(interaction: nextcord.Interaction):
+@search.on_autocomplete("recherche")
+async def search_recherche_autocomplete(interaction: nextcord.Interaction, recherche: str):
+    await interaction.response.send_autocomplete(await suggest_names(interaction.user.id, recherche or ""))
+
+@bot.slash_command(description="Voir les statistiques de votre liste")
+async def stats(interaction: nextcord.Interaction):
     user_id = interaction.user.id
-    user_data = load_user_data(user_id)
 
-    if not any(user_data.values()):  # Vérifie si la liste est vide
+    # Statistiques tenues à jour par le stockage : aucun parcours de la liste
+    user_stats = await storage.user_stats(user_id)
+    total = user_stats.count()
+    if not total:
         await interaction.response.send_message("Votre liste est vide.", ephemeral=True)
         return
 
-    # Générer le contenu du fichier
-    file_content = "Votre liste de médias (triée par catégorie et statut) :\n\n"
+    embed = nextcord.Embed(
+        title="Vos statistiques",
+        description=f"{total} médias, dont {round(user_stats.completion() * 100)} % terminés",
+        color=nextcord.Color.blue()
+    )
+    for category in CATEGORIES:
+        count = user_stats.count(category)
+        if not count:
+            continue
+        lines = [f"{statut.capitalize()} : {user_stats.count(category, statut)}" for statut in STATUSES]
+        lines.append(f"Terminés à {round(user_stats.completion(category) * 100)} %")
+        embed.add_field(name=f"{category.capitalize()} ({count})", value="\n".join(lines), inline=True)
+    embed.add_field(
+        name="Progression",
+        value=f"Épisodes suivis : {user_stats.episodes()}\nChapitres suivis : {user_stats.chapters()}",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed)
 
-    # Définir l'ordre des statuts pour le tri
-    statut_order = {
-        "en cours": 1,
-        "terminé": 2,
-        "prévu": 3,
-    }
+@bot.slash_command(description="Voir qui, sur ce serveur, a un titre dans sa liste", dm_permission=False)
+async def watchers(
+    interaction: nextcord.Interaction,
+    nom: str = SlashOption(name="nom", description="Le nom du film, de la série, du manga ou de l'anime"),
+    type: str = SlashOption(name="type", choices={"film": "film", "série": "série", "manga": "manga", "anime": "anime"}, required=False, description="Le type de média")
+):
+    if interaction.guild_id is None:
+        await interaction.response.send_message("Cette commande n'est disponible que sur un serveur.", ephemeral=True)
+        return
 
-    # Fonction pour formater les détails des médias
-    def format_media_details(media):
-        details = []
-        if media.get('saison') is not None:
-            details.append(f"Saison : {media['saison']}")
-        if media.get('episode') is not None:
-            details.append(f"Épisode : {media['episode']}")
-        if media.get('volume') is not None:
-            details.append(f"Volume : {media['volume']}")
-        if media.get('chapitre') is not None:
-            details.append(f"Chapitre : {media['chapitre']}")
-        return " - " + ", ".join(details) if details else ""
-
-    # Fonction pour trier et afficher une catégorie
-    def format_category(category_name, medias):
-        category_content = f"{category_name.capitalize()} :\n"
-        # Trier les médias par statut en utilisant l'ordre défini
-        medias_sorted = sorted(medias, key=lambda media: statut_order.get(media['statut'], 99))
-        for media in medias_sorted:
-            details = format_media_details(media)
-            category_content += f"- {media['nom']} (Statut : {media['statut']}){details}\n"
-        return category_content + "\n"
-
-    # Traiter chaque catégorie (films, séries, animes, mangas)
-    for category in ['films', 'séries', 'animes', 'mangas']:
-        medias = user_data.get(category, [])
-        if medias:
-            file_content += format_category(category, medias)
+    results = title_index.watchers(interaction.guild_id, nom, type + 's' if type else None)
+    if not results:
+        await interaction.response.send_message(f"Personne sur ce serveur n'a {capitalize_name(nom)} dans sa liste.", ephemeral=True)
+        return
+
+    embed = nextcord.Embed(title=f"Qui a {results[0][1]} dans sa liste", color=nextcord.Color.blue())
+    for category, _, users in results:
+        lines = [f"<@{user_id}> : {statut}" for user_id, statut in sorted(users.items(), key=lambda item: item[1])]
+        value = "\n".join(lines)
+        if len(value) > 1024:
+            value = value[:1023] + "…"
+        embed.add_field(name=f"{category.capitalize()} ({len(users)})", value=value, inline=False)
+    await interaction.response.send_message(embed=embed)
+
+@bot.slash_command(description="Voir les titres les plus présents sur ce serveur", dm_permission=False)
+async def top(
+    interaction: nextcord.Interaction,
+    statut: str = SlashOption(name="statut", choices={"prévu": "prévu", "en cours": "en cours", "terminé": "terminé"}, required=False, description="Statut de visionnage (prévu par défaut)"),
+    type: str = SlashOption(name="type", choices={"film": "film", "série": "série", "manga": "manga", "anime": "anime"}, required=False, description="Le type de média")
+):
+    if interaction.guild_id is None:
+        await interaction.response.send_message("Cette commande n'est disponible que sur un serveur.", ephemeral=True)
+        return
+
+    statut = statut or "prévu"
+    ranking = title_index.top(interaction.guild_id, statut, type + 's' if type else None, TOP_MAX_TITLES)
+    if not ranking:
+        await interaction.response.send_message(f"Aucun titre {statut} sur ce serveur.", ephemeral=True)
+        return
+
+    lines = [
+        f"{rank}. {nom} ({category}) : {count} membre{'s' if count > 1 else ''}"
+        for rank, ((category, nom), count) in enumerate(ranking, start=1)
+    ]
+    embed = nextcord.Embed(
+        title=f"Titres les plus présents sur ce serveur ({statut})",
+        description="\n".join(lines),
+        color=nextcord.Color.blue()
+    )
+    await interaction.response.send_message(embed=embed)
+
+@bot.slash_command(description="Exporter votre liste de films, séries, mangas et animes, triée par catégorie et statut")
+async def export(
+    interaction: nextcord.Interaction,
+    export_format: str = SlashOption(name="format", choices={"texte": "txt", "CSV": "csv", "JSON": "json"}, required=False, description="Format du fichier exporté")
+):
+    user_id = interaction.user.id
+    export_format = export_format or "txt"
+    user_data = await storage.load(user_id)
+
+    total = sum(len(medias) for medias in user_data.values())
+    if not total:  # Vérifie si la liste est vide
+        await interaction.response.send_message("Votre liste est vide.", ephemeral=True)
+        return
 
-    # Sauvegarder le fichier dans le répertoire temporaire avec l'encodage UTF-8
-    file_name = f"{user_id}_media_list.txt"
-    file_path = os.path.join(DATA_DIR, file_name)
+    # Pour les grandes listes, répond tout de suite pour ne pas dépasser le délai de Discord
+    deferred = total > EXPORT_DEFER_THRESHOLD
+    if deferred:
+        await interaction.response.defer()
 
-    with open(file_path, "w", encoding="utf-8") as file:  # Utilisation de l'encodage UTF-8
-        file.write(file_content)
+    # Génère le fichier en mémoire, hors de la boucle d'événements
+    loop = asyncio.get_running_loop()
+    buffer = await loop.run_in_executor(None, build_export, user_data, export_format)
+    file = nextcord.File(buffer, filename=f"{user_id}_media_list.{export_format}")
 
     # Envoyer le fichier à l'utilisateur
-    file = nextcord.File(file_path, filename=file_name)
-    await interaction.response.send_message("Voici votre liste de médias triée :", file=file)
+    if deferred:
+        await interaction.followup.send("Voici votre liste de médias triée :", file=file)
+    else:
+        await interaction.response.send_message("Voici votre liste de médias triée :", file=file)
+
+@bot.slash_command(name="import", description="Importer des médias depuis un fichier CSV ou JSON au format de /export")
+async def import_medias(
+    interaction: nextcord.Interaction,
+    fichier: nextcord.Attachment = SlashOption(name="fichier", description="Fichier .csv ou .json exporté par /export")
+):
+    user_id = interaction.user.id
+    import_format = os.path.splitext(fichier.filename)[1].lower().lstrip(".")
+    if import_format not in ("csv", "json"):
+        await interaction.response.send_message("Le fichier doit être au format .csv ou .json.", ephemeral=True)
+        return
+    if fichier.size > IMPORT_MAX_SIZE:
+        await interaction.response.send_message(f"Le fichier ne doit pas dépasser {IMPORT_MAX_SIZE // 1024} Ko.", ephemeral=True)
+        return
+
+    # Le téléchargement et la validation peuvent dépasser le délai de Discord
+    await interaction.response.defer()
+    content = await fichier.read()
+    loop = asyncio.get_running_loop()
+    try:
+        entries, rejected = await loop.run_in_executor(None, parse_import, content, import_format)
+    except ValueError as error:
+        await interaction.followup.send(f"Impossible de lire le fichier : {error}")
+        return
+
+    # Une seule écriture pour tout le fichier ; les médias déjà présents sont ignorés
+    added = await storage.insert_many(user_id, entries)
+
+    embed = nextcord.Embed(title="Import terminé", color=nextcord.Color.blue())
+    embed.add_field(name="Ajoutés", value=str(added), inline=True)
+    embed.add_field(name="Déjà dans la liste", value=str(len(entries) - added), inline=True)
+    embed.add_field(name="Rejetés", value=str(len(rejected)), inline=True)
+    if rejected:
+        unit = "Ligne" if import_format == "csv" else "Média"
+        lines = [f"{unit} {position} : {reason}" for position, reason in rejected[:IMPORT_MAX_REJECTED_SHOWN]]
+        if len(rejected) > IMPORT_MAX_REJECTED_SHOWN:
+            lines.append(f"… et {len(rejected) - IMPORT_MAX_REJECTED_SHOWN} autres")
+        embed.add_field(name="Médias rejetés", value="\n".join(lines)[:1024], inline=False)
+    await interaction.followup.send(embed=embed)
+
+def format_bytes(size):
+    """Formate une taille en octets, Kio ou Mio."""
+    for unit in ("o", "Kio"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} Mio"
+
+def format_histograms(histograms, errors=None):
+    """Une ligne par histogramme : appels, p50, p95 et erreurs éventuelles, les plus fréquents d'abord."""
+    lines = []
+    for name, histogram in sorted(histograms.items(), key=lambda item: -item[1].count):
+        line = f"{name} : {histogram.count} × p50 ≤ {histogram.quantile(0.5) * 1000:g} ms, p95 ≤ {histogram.quantile(0.95) * 1000:g} ms"
+        if errors and errors.get(name):
+            line += f", {errors[name]} erreur{'s' if errors[name] > 1 else ''}"
+        lines.append(line)
+    value = "\n".join(lines) or "Aucune mesure"
+    return value if len(value) <= 1024 else value[:1023] + "…"
+
+@bot.slash_command(name="metrics", description="Voir les métriques du bot (propriétaire uniquement)")
+async def metrics_command(interaction: nextcord.Interaction):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("Cette commande est réservée au propriétaire du bot.", ephemeral=True)
+        return
 
-    # Supprimer le fichier après l'envoi pour éviter d'encombrer le répertoire
-    os.remove(file_path)
+    update_metrics_gauges()
+    embed = nextcord.Embed(title="Métriques", color=nextcord.Color.blue())
+    embed.add_field(
+        name="Commandes",
+        value=format_histograms(
+            metrics.histograms("watchtrack_command_seconds", "command"),
+            metrics.counters("watchtrack_command_errors_total", "command")
+        ),
+        inline=False
+    )
+    embed.add_field(name="Stockage", value=format_histograms(metrics.histograms("watchtrack_storage_seconds", "op")), inline=False)
+    read = sum(metrics.counters("watchtrack_storage_bytes_read_total", "op").values())
+    written = sum(metrics.counters("watchtrack_storage_bytes_written_total", "op").values())
+    embed.add_field(name="Octets lus / écrits", value=f"{format_bytes(read)} / {format_bytes(written)}", inline=False)
+    embed.add_field(name="Embeds paginés", value=format_histograms(metrics.histograms("watchtrack_embed_seconds", "view")), inline=False)
+    caches = ", ".join(f"{stat} : {value}" for stat, value in storage.stats().items())
+    embed.add_field(
+        name="Caches",
+        value=f"{caches or 'aucun'}\nRendu : {render_cache.hits} hits, {render_cache.misses} misses\n"
+              f"/next : {progress.increments} incréments, {progress.writes} écritures",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.slash_command(description="Demander des explications en cas de doute ou de difficulté")
 async def explanations(interaction: nextcord.Interaction):
@@ -465,6 +756,11 @@ async def explanations(interaction: nextcord.Interaction):
         value="Permet de modifier le statut de visionnage ou de supprimer un film, une série, un manga ou un anime de votre liste.",
         inline=False
     )
+    embed.add_field(
+        name="/next",
+        value="Passe à l'épisode suivant (ou au chapitre suivant pour un manga) d'un média de votre liste, sans tout ressaisir comme avec /edit.",
+        inline=False
+    )
     embed.add_field(
         name="/list",
         value="Permet de voir la liste complète de vos films, séries, mangas et animes par ordre alphabétique.",
@@ -477,12 +773,32 @@ async def explanations(interaction: nextcord.Interaction):
     )
     embed.add_field(
         name="/search",
-        value="Permet de rechercher un film, une série, un manga ou un anime dans votre liste en fonction du nom ou d'une partie du nom. Retourne tous les résultats correspondants.",
+        value="Permet de rechercher un film, une série, un manga ou un anime dans votre liste en fonction du nom ou d'une partie du nom, même avec une faute de frappe. Retourne les résultats les plus proches en premier.",
+        inline=False
+    )
+    embed.add_field(
+        name="/stats",
+        value="Affiche le nombre de médias par catégorie et par statut, la part de médias terminés et le total des épisodes et chapitres suivis.",
+        inline=False
+    )
+    embed.add_field(
+        name="/watchers",
+        value="Sur un serveur, montre quels membres ont un titre dans leur liste, avec leur statut.",
+        inline=False
+    )
+    embed.add_field(
+        name="/top",
+        value="Sur un serveur, classe les titres les plus présents dans les listes des membres pour un statut (prévu par défaut).",
         inline=False
     )
     embed.add_field(
         name="/export",
-        value="Exporte votre liste de films, séries, mangas et animes dans un fichier texte que vous pouvez télécharger.",
+        value="Exporte votre liste de films, séries, mangas et animes dans un fichier texte, CSV ou JSON que vous pouvez télécharger.",
+        inline=False
+    )
+    embed.add_field(
+        name="/import",
+        value="Importe en une fois les médias d'un fichier CSV ou JSON au format de /export. Les médias déjà présents dans votre liste sont ignorés.",
         inline=False
     )
     embed.add_field(
@@ -494,4 +810,15 @@ async def explanations(interaction: nextcord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 
-bot.run(TOKEN)  # Remplacez par le token de votre bot
\ No newline at end of file
+if __name__ == "__main__":
+    # Sous garde : les processus du pool de reconstruction réimportent ce module sur certaines plateformes
+    load_title_index()
+
+    bot.run(TOKEN)  # Remplacez par le token de votre bot
+
+    # Écrit les dernières modifications avant de quitter, puis l'index global après les fichiers utilisateur
+    storage.close()
+    if trace_recorder is not None:
+        trace_recorder.close()
+    title_index.save(title_index.snapshot(), clean=True)
+    print(f"Stockage : {storage.stats()}")
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+
+
+class UserDataCache:
+    """Cache LRU des données utilisateur, avec suivi des entrées à écrire sur disque.
+
+    Les entrées modifiées (« sales ») ne sont jamais évincées avant d'avoir été
+    écrites : les limites sont donc dépassées temporairement tant qu'un flush
+    n'a pas eu lieu.
+    """
+
+    def __init__(self, max_users=256, max_medias=None):
+        self.max_users = max_users
+        self.max_medias = max_medias  # Approximation de la mémoire occupée
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_medias = 0
+        self._dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.evictions = 0
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, user_id):
+        """Retourne les données en cache de l'utilisateur, ou None."""
+        data = self._entries.get(user_id)
+        if data is None:
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return data
+
+    def insert(self, user_id, data):
+        """Ajoute des données lues sur disque et retourne celles qui font foi.
+
+        Si une lecture concurrente a déjà rempli le cache, la version en cache
+        est conservée pour ne pas perdre de modification.
+        """
+        if user_id in self._entries:
+            return self._entries[user_id]
+        self.misses += 1
+        self._store(user_id, data)
+        self._evict()
+        return data
+
+    def put(self, user_id, data):
+        """Enregistre les données de l'utilisateur et les marque comme modifiées."""
+        self._store(user_id, data)
+        self._dirty.add(user_id)
+        self._evict()
+
+    def dirty_items(self):
+        """Retourne la liste des couples (user_id, données) à écrire."""
+        return [(user_id, self._entries[user_id]) for user_id in self._entries if user_id in self._dirty]
+
+    def mark_clean(self, user_id):
+        """Indique que les données de l'utilisateur ont été écrites."""
+        if user_id in self._dirty:
+            self._dirty.discard(user_id)
+            self.flushes += 1
+
+    def mark_dirty(self, user_id):
+        """Marque à nouveau l'utilisateur comme modifié (écriture échouée)."""
+        if user_id in self._entries:
+            self._dirty.add(user_id)
+
+    def stats(self):
+        """Retourne les compteurs du cache."""
+        return {
+            'utilisateurs': len(self._entries),
+            'médias': self._total_medias,
+            'modifiés': len(self._dirty),
+            'hits': self.hits,
+            'misses': self.misses,
+            'flushes': self.flushes,
+            'évictions': self.evictions,
+        }
+
+    def _store(self, user_id, data):
+        self._total_medias -= self._sizes.get(user_id, 0)
+        size = sum(len(medias) for medias in data.values())
+        self._entries[user_id] = data
+        self._entries.move_to_end(user_id)
+        self._sizes[user_id] = size
+        self._total_medias += size
+
+    def _over_limit(self):
+        if self.max_users is not None and len(self._entries) > self.max_users:
+            return True
+        return self.max_medias is not None and self._total_medias > self.max_medias
+
+    def _evict(self):
+        # Parcourt les entrées de la moins récemment utilisée à la plus récente,
+        # en gardant toujours la dernière entrée touchée.
+        if not self._over_limit():
+            return
+        candidates = [user_id for user_id in list(self._entries)[:-1] if user_id not in self._dirty]
+        for user_id in candidates:
+            if not self._over_limit():
+                break
+            del self._entries[user_id]
+            self._total_medias -= self._sizes.pop(user_id)
+            self.evictions += 1
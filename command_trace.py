@@ -0,0 +1,63 @@
+import json
+import time
+
+# Commandes qui ne peuvent pas être rejouées hors ligne (pièce jointe à télécharger)
+UNREPLAYABLE_COMMANDS = {"import"}
+
+
+class TraceRecorder:
+    """Enregistre les commandes reçues, une ligne JSON par commande, pour les rejouer hors ligne.
+
+    Chaque ligne donne le moment de réception (en secondes depuis le début de
+    l'enregistrement), l'utilisateur, le serveur, la commande et ses options
+    sous le nom des paramètres de la fonction.
+    """
+
+    def __init__(self, path):
+        # Écriture par ligne : une trace reste lisible après un arrêt brutal
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._started = time.monotonic()
+
+    def record(self, interaction):
+        command = interaction.application_command
+        options = {}
+        for option in (interaction.data or {}).get("options", []):
+            parameter = command.options.get(option["name"])
+            options[parameter.functional_name if parameter else option["name"]] = option.get("value")
+        self._file.write(json.dumps({
+            't': round(time.monotonic() - self._started, 4),
+            'user': interaction.user.id,
+            'guild': interaction.guild_id,
+            'command': command.name,
+            'options': options,
+        }, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+def read_trace(path):
+    """Lit une trace : retourne (paramètres de préparation ou None, événements triés par instant).
+
+    Une première ligne {"setup": {...}} décrit les données à générer avant le rejeu.
+    """
+    setup = None
+    events = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'setup' in record:
+                setup = record['setup']
+            else:
+                events.append(record)
+    events.sort(key=lambda event: event['t'])
+    return setup, events
+
+def write_trace(path, events, setup=None):
+    """Écrit une trace lisible par `read_trace`."""
+    with open(path, "w", encoding="utf-8") as file:
+        if setup is not None:
+            file.write(json.dumps({'setup': setup}) + "\n")
+        for event in events:
+            file.write(json.dumps(event, ensure_ascii=False) + "\n")
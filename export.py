@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+
+from media import CATEGORIES, PROGRESS_FIELDS, STATUSES
+from render import format_media_details
+
+# Ordre des catégories et des statuts dans les exports
+EXPORT_CATEGORIES = ['films', 'séries', 'animes', 'mangas']
+STATUT_ORDER = {
+    "en cours": 1,
+    "terminé": 2,
+    "prévu": 3,
+}
+
+# Colonnes de l'export CSV, relues par /import
+CSV_COLUMNS = ['type', 'nom', 'statut'] + PROGRESS_FIELDS
+
+# Longueur maximale d'un nom importé
+MAX_NAME_LENGTH = 200
+
+def iter_text(data):
+    """Génère l'export texte, trié par catégorie et statut."""
+    yield "Votre liste de médias (triée par catégorie et statut) :\n\n"
+    for category in EXPORT_CATEGORIES:
+        medias = data.get(category, [])
+        if not medias:
+            continue
+        yield f"{category.capitalize()} :\n"
+        # Trier les médias par statut en utilisant l'ordre défini
+        for media in sorted(medias, key=lambda media: STATUT_ORDER.get(media['statut'], 99)):
+            yield f"- {media['nom']} (Statut : {media['statut']}){format_media_details(media)}\n"
+        yield "\n"
+
+
+class _LineBuffer:
+    """Tampon d'une ligne pour `csv.writer` : `writerow` retourne la ligne écrite."""
+
+    def write(self, line):
+        return line
+
+def iter_csv(data):
+    """Génère l'export CSV, une ligne par média."""
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(CSV_COLUMNS)
+    for category in EXPORT_CATEGORIES:
+        for media in data.get(category, []):
+            yield writer.writerow([category] + [media.get(column, "") for column in CSV_COLUMNS[1:]])
+
+def iter_json(data):
+    """Génère l'export JSON, au même format que les données utilisateur."""
+    yield "{"
+    for i, category in enumerate(EXPORT_CATEGORIES):
+        yield f'{", " if i else ""}{json.dumps(category, ensure_ascii=False)}: ['
+        for j, media in enumerate(data.get(category, [])):
+            yield ("," if j else "") + "\n  " + json.dumps(dict(media), ensure_ascii=False)
+        yield "\n]"
+    yield "}\n"
+
+EXPORT_FORMATS = {
+    'txt': iter_text,
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+def build_export(data, export_format):
+    """Écrit l'export dans un tampon mémoire, prêt à être envoyé."""
+    buffer = io.BytesIO()
+    for chunk in EXPORT_FORMATS[export_format](data):
+        buffer.write(chunk.encode("utf-8"))
+    buffer.seek(0)
+    return buffer
+
+def _parse_entry(category, raw):
+    """Valide un média importé ; lève ValueError avec la raison du rejet."""
+    category = str(category or "").strip().lower()
+    if category not in CATEGORIES and category + 's' in CATEGORIES:
+        category += 's'
+    if category not in CATEGORIES:
+        raise ValueError(f"type inconnu « {category} »")
+    nom = ' '.join(str(raw.get('nom') or "").split())
+    if not nom:
+        raise ValueError("nom manquant")
+    if len(nom) > MAX_NAME_LENGTH:
+        raise ValueError("nom trop long")
+    statut = str(raw.get('statut') or "").strip().lower()
+    if statut not in STATUSES:
+        raise ValueError(f"statut inconnu « {statut} »")
+
+    entry = {'nom': nom, 'statut': statut}
+    for field in PROGRESS_FIELDS:
+        value = raw.get(field)
+        if value is None or value == "":
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} invalide « {value} »") from None
+        if value < 0:
+            raise ValueError(f"{field} négatif")
+        entry[field] = value
+    return category, entry
+
+def _iter_csv_rows(text):
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None or not {'type', 'nom', 'statut'} <= set(reader.fieldnames):
+        raise ValueError("colonnes type, nom et statut attendues")
+    for row in reader:
+        yield reader.line_num, row.get('type'), row
+
+def _iter_json_rows(text):
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("objet JSON par catégorie attendu")
+    position = 0
+    for category, medias in data.items():
+        if category == 'journal_seq':
+            continue
+        for raw in medias if isinstance(medias, list) else [medias]:
+            position += 1
+            yield position, category, raw if isinstance(raw, dict) else {}
+
+def iter_import(content, import_format):
+    """Itère sur les médias d'un fichier au format de /export.
+
+    Produit (position, catégorie, média, None) pour un média valide et
+    (position, None, None, raison) pour un média rejeté. Lève ValueError si
+    le fichier lui-même est illisible.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("le fichier n'est pas encodé en UTF-8") from None
+    rows = _iter_csv_rows(text) if import_format == 'csv' else _iter_json_rows(text)
+    for position, category, raw in rows:
+        try:
+            category, entry = _parse_entry(category, raw)
+        except ValueError as error:
+            yield position, None, None, str(error)
+        else:
+            yield position, category, entry, None
+
+def parse_import(content, import_format):
+    """Valide tout le fichier et retourne ([(catégorie, média)], [(position, raison)])."""
+    entries = []
+    rejected = []
+    try:
+        for position, category, entry, error in iter_import(content, import_format):
+            if error is None:
+                entries.append((category, entry))
+            else:
+                rejected.append((position, error))
+    except csv.Error as error:
+        raise ValueError(f"CSV invalide : {error}") from None
+    except json.JSONDecodeError as error:
+        raise ValueError(f"JSON invalide : {error.msg} (ligne {error.lineno})") from None
+    return entries, rejected
@@ -0,0 +1,115 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+def built(build):
+    """Indique si la tâche de construction d'un index est terminée avec succès."""
+    return build.done() and not build.cancelled() and build.exception() is None
+
+
+class MediaIndex(ABC):
+    """Index des médias d'un utilisateur, tenu à jour par les notifications du stockage."""
+
+    @classmethod
+    @abstractmethod
+    def build(cls, data):
+        """Construit l'index à partir de toutes les données de l'utilisateur, par catégorie."""
+
+    @abstractmethod
+    def add(self, category, key, entry):
+        """Ajoute ou remplace un média."""
+
+    @abstractmethod
+    def remove(self, category, key):
+        """Retire un média."""
+
+    def apply(self, category, key, entry):
+        """Répercute une notification du stockage : ajout ou remplacement, suppression si le média vaut None."""
+        if entry is None:
+            self.remove(category, key)
+        else:
+            self.add(category, key, entry)
+
+
+class IndexCache:
+    """Index des médias par utilisateur, construits à la demande et gardés en LRU.
+
+    Les index d'un utilisateur partagent une seule entrée du cache et une seule
+    lecture du stockage. Les types d'index sont construits l'un après l'autre
+    dans le pool de threads du stockage, dans l'ordre donné : le premier est
+    disponible sans attendre les suivants. Les index sont tenus à jour par les notifications
+    du stockage, y compris celles reçues pendant la construction, rejouées
+    ensuite dans l'ordre.
+    """
+
+    def __init__(self, storage, index_types, max_users=128):
+        self.storage = storage
+        self.index_types = index_types
+        self.max_users = max_users
+        self._builds = OrderedDict()  # user_id → {type d'index: tâche de construction}
+        self._changes = {}            # user_id → modifications reçues pendant la construction
+        storage.add_listener(self.on_change)
+
+    def on_change(self, user_id, category, key, entry):
+        """Répercute une modification du stockage sur les index de l'utilisateur."""
+        builds = self._builds.get(user_id)
+        if builds is None:
+            return
+        changes = self._changes.get(user_id)
+        if changes is not None:
+            # Rejouée par les index encore en construction
+            changes.append((category, key, entry))
+        for build in builds.values():
+            if built(build):
+                build.result().apply(category, key, entry)
+
+    async def get(self, user_id, index_type):
+        """Retourne l'index de l'utilisateur, construit au besoin."""
+        # La construction se poursuit pour les autres appelants si celui-ci est annulé
+        return await asyncio.shield(self._user_builds(user_id)[index_type])
+
+    def peek(self, user_id, index_type):
+        """Retourne l'index de l'utilisateur s'il est déjà construit ; sinon lance sa construction et retourne None."""
+        build = self._user_builds(user_id)[index_type]
+        return build.result() if built(build) else None
+
+    def _user_builds(self, user_id):
+        builds = self._builds.get(user_id)
+        if builds is not None:
+            self._builds.move_to_end(user_id)
+            return builds
+
+        changes = self._changes[user_id] = []
+        data = asyncio.ensure_future(self.storage.load(user_id))
+        builds = {}
+        previous = None
+        for index_type in self.index_types:
+            previous = builds[index_type] = asyncio.ensure_future(self._build(data, index_type, changes, previous))
+            previous.add_done_callback(lambda build: self._settle(user_id, builds, build))
+        self._builds[user_id] = builds
+        while len(self._builds) > self.max_users:
+            evicted, _ = self._builds.popitem(last=False)
+            self._changes.pop(evicted, None)
+        return builds
+
+    async def _build(self, data, index_type, changes, previous):
+        if previous is not None:
+            # Une construction après l'autre, dans l'ordre des types : les threads se partagent le GIL
+            await asyncio.wait([previous])
+        # Plusieurs secondes pour 100 000 médias : la construction ne bloque pas la boucle d'événements
+        index = await self.storage.run_in_executor(index_type.build, await data)
+        # Modifications notifiées depuis le début de la lecture ; rejouer celles déjà lues est sans effet
+        for category, key, entry in changes:
+            index.apply(category, key, entry)
+        return index
+
+    def _settle(self, user_id, builds, build):
+        if self._builds.get(user_id) is not builds:
+            return
+        if not built(build):
+            # Une lecture ou une construction échouée est retentée au prochain appel
+            del self._builds[user_id]
+            self._changes.pop(user_id, None)
+        elif all(built(other) for other in builds.values()):
+            self._changes.pop(user_id, None)
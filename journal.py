@@ -0,0 +1,178 @@
+import glob
+import json
+import os
+
+from media import MediaEntry, normalize_name
+from metrics import metrics
+from storage import (DATA_DIR, JsonStorage, atomic_write, decode_user_data, dump_user_data,
+                     encode_user_data, index_user_data, user_data_lists)
+
+def snapshot_path(user_id, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"{user_id}.json")
+
+def journal_path(user_id, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"{user_id}.log")
+
+def encode_record(seq, record):
+    """Sérialise un enregistrement (op, catégorie, média ou nom) en une ligne compacte."""
+    op, category, payload = record
+    line = {'s': seq, 'op': op, 'c': category}
+    if op == 'put':
+        line['e'] = payload.to_row()
+    else:
+        line['n'] = payload
+    return json.dumps(line, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+def apply_record(index, line):
+    """Rejoue un enregistrement du journal sur les données indexées."""
+    category = line['c']
+    medias = index[category]
+    if line['op'] == 'put':
+        # Média sous forme compacte, ou de dictionnaire dans les journaux plus anciens
+        entry = MediaEntry.from_json(line['e'])
+        key = normalize_name(entry.nom)
+        if key in medias:
+            index.stats.replace(category, medias[key], entry)
+        else:
+            index.stats.add(category, entry)
+        medias[key] = entry
+    else:
+        media = medias.pop(normalize_name(line['n']), None)
+        if media is not None:
+            index.stats.remove(category, media)
+
+@metrics.timed("watchtrack_storage_seconds", op="journal_read")
+def read_journal(user_id, data_dir=DATA_DIR):
+    """Lit l'instantané puis rejoue les enregistrements qui lui sont postérieurs.
+
+    Retourne les données indexées, le dernier numéro de séquence et le nombre
+    d'enregistrements rejoués.
+    """
+    raw = {}
+    if os.path.exists(snapshot_path(user_id, data_dir)):
+        with open(snapshot_path(user_id, data_dir), "rb") as file:
+            content = file.read()
+        metrics.inc("watchtrack_storage_bytes_read_total", len(content), op="snapshot")
+        raw = json.loads(content)
+    seq = raw.get('journal_seq', 0)
+    index = index_user_data(decode_user_data(raw), raw.get('stats'), user_id)
+
+    replayed = 0
+    if os.path.exists(journal_path(user_id, data_dir)):
+        with open(journal_path(user_id, data_dir), "rb") as file:
+            for raw_line in file:
+                metrics.inc("watchtrack_storage_bytes_read_total", len(raw_line), op="journal")
+                try:
+                    line = json.loads(raw_line)
+                except ValueError:
+                    # Enregistrement tronqué par un arrêt brutal
+                    continue
+                if line['s'] > seq:
+                    apply_record(index, line)
+                    seq = line['s']
+                    replayed += 1
+    return index, seq, replayed
+
+@metrics.timed("watchtrack_storage_seconds", op="journal_append")
+def append_journal(user_id, lines):
+    """Ajoute des enregistrements à la fin du journal et les force sur disque."""
+    content = "".join(lines).encode("utf-8")
+    metrics.inc("watchtrack_storage_bytes_written_total", len(content), op="journal")
+    with open(journal_path(user_id), "ab") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+
+@metrics.timed("watchtrack_storage_seconds", op="snapshot")
+def write_snapshot(user_id, index, seq):
+    """Remplace atomiquement l'instantané, puis vide le journal qu'il intègre."""
+    raw = encode_user_data(user_data_lists(index), index.stats)
+    atomic_write(snapshot_path(user_id), dump_user_data({**raw, 'journal_seq': seq}), op="snapshot")
+    if os.path.exists(journal_path(user_id)):
+        os.remove(journal_path(user_id))
+
+
+class JournalStorage(JsonStorage):
+    """Stockage JSON journalisé : chaque modification est ajoutée à un journal par utilisateur.
+
+    Le compactage intègre périodiquement le journal dans l'instantané `<id>.json`,
+    remplacé de façon atomique. Les enregistrements postérieurs à l'instantané
+    sont rejoués à la lecture.
+    """
+
+    def __init__(self, cache, compact_records=100, max_workers=4):
+        super().__init__(cache, max_workers)
+        self.compact_records = compact_records
+        self._seqs = {}
+        self._pending = {}  # Enregistrements pas encore intégrés à l'instantané
+
+    def recover(self):
+        """Compacte au démarrage tous les journaux laissés par l'exécution précédente."""
+        recovered = 0
+        for path in glob.glob(os.path.join(DATA_DIR, "*.log")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            # Les autres fichiers `.log` du répertoire ne sont pas des journaux d'utilisateur
+            if not name.isdigit():
+                continue
+            user_id = int(name)
+            index, seq, replayed = read_journal(user_id)
+            write_snapshot(user_id, index, seq)
+            recovered += replayed
+        return recovered
+
+    async def _load_unlocked(self, user_id):
+        # À appeler sous le verrou d'écriture
+        index = self.cache.lookup(user_id)
+        if index is None:
+            index, seq, replayed = await self._run(read_journal, user_id)
+            self._seqs[user_id] = seq
+            self._pending[user_id] = replayed
+            index = self.cache.insert(user_id, index)
+        return index
+
+    async def _commit(self, user_id, index, records):
+        # Les données restent « sales » (non évinçables) jusqu'à ce que le journal soit écrit
+        self.cache.put(user_id, index)
+        lines = []
+        for record in records:
+            self._seqs[user_id] = self._seqs.get(user_id, 0) + 1
+            lines.append(encode_record(self._seqs[user_id], record))
+        await self._run(append_journal, user_id, lines)
+        self._pending[user_id] = self._pending.get(user_id, 0) + len(lines)
+        self.cache.mark_clean(user_id)
+
+    async def _compact(self, user_id):
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            await self._run(write_snapshot, user_id, index, self._seqs.get(user_id, 0))
+            self._pending.pop(user_id, None)
+            self.cache.mark_clean(user_id)
+
+    async def flush(self):
+        """Compacte les journaux devenus trop longs et retourne leur nombre.
+
+        Les utilisateurs dont l'ajout au journal a échoué sont aussi compactés.
+        """
+        user_ids = {user_id for user_id, pending in self._pending.items() if pending >= self.compact_records}
+        user_ids.update(user_id for user_id, _ in self.cache.dirty_items())
+        compacted = 0
+        for user_id in user_ids:
+            try:
+                await self._compact(user_id)
+            except OSError as error:
+                print(f"Échec du compactage du journal de {user_id} : {error}")
+                continue
+            compacted += 1
+        return compacted
+
+    def close(self):
+        """Compacte tous les journaux de façon synchrone et libère le pool."""
+        self._executor.shutdown()
+        for user_id, index in self.cache.dirty_items():
+            write_snapshot(user_id, index, self._seqs.get(user_id, 0))
+            self.cache.mark_clean(user_id)
+            self._pending.pop(user_id, None)
+        for user_id, pending in self._pending.items():
+            if pending:
+                index, seq, _ = read_journal(user_id)
+                write_snapshot(user_id, index, seq)
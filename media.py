@@ -0,0 +1,138 @@
+import unicodedata
+from enum import Enum
+
+
+class Category(Enum):
+    """Catégories de médias, avec leur nom tel qu'il est stocké."""
+    FILMS = 'films'
+    SERIES = 'séries'
+    MANGAS = 'mangas'
+    ANIMES = 'animes'
+
+
+class Status(Enum):
+    """Statuts de visionnage ; leur position sert de code dans le format compact."""
+    EN_COURS = 'en cours'
+    TERMINE = 'terminé'
+    PREVU = 'prévu'
+
+
+CATEGORIES = [category.value for category in Category]
+STATUSES = [status.value for status in Status]
+STATUS_BY_CODE = list(Status)
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_BY_CODE)}
+STATUS_BY_VALUE = {status.value: status for status in Status}
+
+# Champs de progression, dans l'ordre d'affichage
+PROGRESS_FIELDS = ['saison', 'episode', 'volume', 'chapitre']
+
+def normalize_name(name):
+    """Normalise le nom pour comparer les médias : casse, accents et espaces.
+
+    « Pokémon » et « pokemon » donnent la même clé.
+    """
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+def capitalize_name(name):
+    """Met en majuscule la première lettre de chaque mot dans le nom."""
+    return ' '.join(word.capitalize() for word in name.split())
+
+
+class MediaEntry:
+    """Média d'une liste, en mémoire compacte (`__slots__`, statut partagé via `Status`).
+
+    Se lit comme un dictionnaire en lecture seule : `media['nom']`, `media.get('saison')`
+    et `dict(media)` se comportent comme avec l'ancien format, les champs vides
+    étant absents.
+    """
+
+    __slots__ = ('nom', 'statut', 'saison', 'episode', 'volume', 'chapitre')
+
+    FIELDS = ('nom', 'statut') + tuple(PROGRESS_FIELDS)
+
+    def __init__(self, nom, statut, saison=None, episode=None, volume=None, chapitre=None):
+        # `statut` est un membre de Status : la conversion est faite par les constructeurs ci-dessous
+        self.nom = nom
+        self.statut = statut
+        self.saison = saison
+        self.episode = episode
+        self.volume = volume
+        self.chapitre = chapitre
+
+    @classmethod
+    def from_dict(cls, data):
+        """Construit un média à partir de son ancien format dictionnaire."""
+        return cls(data.get('nom'), Status(data.get('statut')), *(data.get(field) for field in PROGRESS_FIELDS))
+
+    @classmethod
+    def from_row(cls, row):
+        """Construit un média à partir de sa forme compacte [nom, code du statut, progression…]."""
+        return cls(row[0], STATUS_BY_CODE[row[1]], *row[2:])
+
+    @classmethod
+    def from_json(cls, value):
+        """Construit un média sérialisé sous forme compacte ou de dictionnaire."""
+        return cls.from_row(value) if isinstance(value, list) else cls.from_dict(value)
+
+    def to_row(self):
+        """Retourne la forme compacte du média, sans les champs vides en fin de ligne."""
+        row = [self.nom, STATUS_CODES[self.statut], self.saison, self.episode, self.volume, self.chapitre]
+        while row[-1] is None:
+            row.pop()
+        return row
+
+    def to_dict(self):
+        """Retourne le média sous forme de dictionnaire modifiable."""
+        return {field: self[field] for field in self.keys()}
+
+    def keys(self):
+        return [field for field in self.FIELDS if getattr(self, field) is not None]
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        value = getattr(self, field)
+        if value is None:
+            raise KeyError(field)
+        return self.statut.value if field == 'statut' else value
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+        return field in self.FIELDS and getattr(self, field) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, MediaEntry):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MediaEntry({self.to_dict()!r})"
+
+def unique_entry(media, keys):
+    """Retourne le média, renommé « nom (2) », « nom (3) »… si son nom normalisé figure déjà dans `keys`.
+
+    Sert aux listes antérieures à la normalisation des accents et de la casse,
+    où « Pokémon » et « Pokemon » pouvaient coexister : aucun des deux n'est perdu.
+    """
+    nom, n = media.nom, 1
+    while normalize_name(nom) in keys:
+        n += 1
+        nom = f"{media.nom} ({n})"
+    if nom == media.nom:
+        return media
+    return MediaEntry(nom, media.statut, media.saison, media.episode, media.volume, media.chapitre)
+
+def to_entry(media):
+    """Retourne le média sous forme de MediaEntry, qu'il soit déjà typé ou un dictionnaire."""
+    return media if isinstance(media, MediaEntry) else MediaEntry.from_dict(media)
@@ -0,0 +1,150 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Bornes des histogrammes de durée, en secondes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histogramme à bornes fixes, au sens de Prometheus."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Dernière case : au-delà de la plus grande borne
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estime un quantile : borne supérieure de la case qui le contient."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Compteurs et histogrammes étiquetés, alimentés depuis la boucle et le pool de threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (nom, étiquettes) → valeur
+        self._histograms = {}  # (nom, étiquettes) → Histogram
+        self._gauges = {}      # (nom, étiquettes) → valeur
+        self._help = {}
+
+    def describe(self, name, text):
+        """Enregistre la description d'une métrique, reprise dans l'export Prometheus."""
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Mesure la durée du bloc, y compris lorsqu'il lève une exception."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Décorateur mesurant la durée de chaque appel d'une fonction synchrone."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def counters(self, name, label=None):
+        """Retourne {valeur de l'étiquette: total} pour un compteur."""
+        with self._lock:
+            return {dict(labels).get(label): value for (counter, labels), value in self._counters.items() if counter == name}
+
+    def histograms(self, name, label=None):
+        """Retourne {valeur de l'étiquette: Histogram} pour un histogramme."""
+        with self._lock:
+            return {dict(labels).get(label): histogram
+                    for (histogram_name, labels), histogram in self._histograms.items() if histogram_name == name}
+
+    def render(self):
+        """Retourne toutes les métriques au format texte de Prometheus."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                values = sorted(values.items())
+                for name in sorted({name for (name, _), _ in values}):
+                    lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(f"{name}{format_labels(labels)} {value}" for (other, labels), value in values if other == name)
+            for name in sorted({name for (name, _), _ in histograms}):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in histograms:
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    """Formate des étiquettes Prometheus : {clé="valeur",...}."""
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+# Registre partagé par le bot et les stockages
+metrics = Metrics()
+metrics.describe("watchtrack_command_seconds", "Durée de traitement des commandes slash")
+metrics.describe("watchtrack_command_errors_total", "Commandes slash terminées par une erreur")
+metrics.describe("watchtrack_storage_seconds", "Durée des lectures et écritures du stockage")
+metrics.describe("watchtrack_storage_bytes_read_total", "Octets lus par le stockage")
+metrics.describe("watchtrack_storage_bytes_written_total", "Octets écrits par le stockage")
+metrics.describe("watchtrack_embed_seconds", "Durée de construction des embeds paginés")
+metrics.describe("watchtrack_storage_stat", "Compteurs du cache des données utilisateur")
+metrics.describe("watchtrack_render_cache_total", "Accès au cache des lignes de /list et /filter")
+metrics.describe("watchtrack_progress_total", "Incréments de /next et écritures regroupées")
+metrics.describe("watchtrack_title_index_titles", "Titres de l'index global")
@@ -0,0 +1,62 @@
+"""Importe les fichiers `user_data/*.json`, et les journaux `*.log` du mode journalisé, dans la base SQLite.
+
+Usage : python migrate.py [--data-dir user_data] [--db watchtrack.db] [--batch 500]
+"""
+import argparse
+import glob
+import os
+
+from journal import read_journal
+from sqlite_storage import COLUMNS, SELECT_COLUMNS, connect, create_schema, entry_to_row, rebuild_stats
+from storage import DATA_DIR
+
+def user_ids(data_dir):
+    """Retourne les utilisateurs ayant un instantané ou un journal, même sans instantané après un arrêt brutal."""
+    paths = glob.glob(os.path.join(data_dir, "*.json")) + glob.glob(os.path.join(data_dir, "*.log"))
+    names = (os.path.splitext(os.path.basename(path))[0] for path in paths)
+    return sorted({int(name) for name in names if name.isdigit()})
+
+def iter_user_rows(user_id, data_dir):
+    """Retourne les lignes à insérer pour un utilisateur : instantané et journal rejoué."""
+    index, _, _ = read_journal(user_id, data_dir)
+    for category, medias in index.items():
+        for entry in medias.values():
+            if entry.nom:
+                yield entry_to_row(user_id, category, entry)
+
+def migrate(data_dir, db_path, batch_size):
+    """Importe les fichiers par lots, chaque lot dans une seule transaction."""
+    connection = connect(db_path)
+    create_schema(connection)
+    placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+    sql = f"INSERT OR IGNORE INTO medias (user_id, category, name_norm, {SELECT_COLUMNS}) VALUES ({placeholders})"
+
+    ids = user_ids(data_dir)
+    users = medias = 0
+    for start in range(0, len(ids), batch_size):
+        rows = []
+        for user_id in ids[start:start + batch_size]:
+            try:
+                rows.extend(iter_user_rows(user_id, data_dir))
+            except (OSError, ValueError, KeyError) as error:
+                print(f"Utilisateur ignoré {user_id} : {error}")
+                continue
+            users += 1
+        connection.execute("BEGIN")
+        medias += connection.executemany(sql, rows).rowcount
+        connection.execute("COMMIT")
+        print(f"{users}/{len(ids)} utilisateurs importés")
+
+    # Les déclencheurs ont tenu les statistiques à jour ; on les recalcule une fois pour repartir d'un état sûr
+    rebuild_stats(connection)
+    connection.execute("ANALYZE")
+    connection.close()
+    print(f"Migration terminée : {users} utilisateurs, {medias} médias.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migre les fichiers JSON des utilisateurs vers SQLite.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--db", default=os.getenv("SQLITE_PATH", "watchtrack.db"))
+    parser.add_argument("--batch", type=int, default=500, help="Nombre d'utilisateurs par transaction")
+    args = parser.parse_args()
+    migrate(args.data_dir, args.db, args.batch)
@@ -0,0 +1,66 @@
+import heapq
+from bisect import bisect_left, insort
+from itertools import islice
+
+from index_cache import MediaIndex
+from media import normalize_name
+
+
+class PrefixIndex(MediaIndex):
+    """Noms d'un utilisateur triés par nom normalisé, par catégorie, pour la recherche par préfixe."""
+
+    def __init__(self):
+        self._keys = {}   # catégorie → noms normalisés triés
+        self._names = {}  # catégorie → nom normalisé → nom affiché
+
+    @classmethod
+    def build(cls, data):
+        """Construit l'index en triant une seule fois les noms de chaque catégorie."""
+        index = cls()
+        for category, medias in data.items():
+            names = index._names[category] = {normalize_name(media['nom']): media['nom'] for media in medias}
+            index._keys[category] = sorted(names)
+        return index
+
+    def add(self, category, key, entry):
+        """Ajoute ou met à jour le nom d'un média."""
+        names = self._names.setdefault(category, {})
+        if key not in names:
+            insort(self._keys.setdefault(category, []), key)
+        names[key] = entry['nom']
+
+    def remove(self, category, key):
+        """Retire un nom de l'index."""
+        if self._names.get(category, {}).pop(key, None) is None:
+            return
+        keys = self._keys[category]
+        del keys[bisect_left(keys, key)]
+
+    def _iter_prefix(self, category, prefix):
+        keys = self._keys.get(category, [])
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            yield keys[i], self._names[category][keys[i]]
+
+    def complete(self, text, category=None, limit=25):
+        """Retourne au plus `limit` noms commençant par le texte, dans l'ordre alphabétique."""
+        prefix = normalize_name(text)
+        categories = [category] if category else list(self._keys)
+        matches = heapq.merge(*(self._iter_prefix(category, prefix) for category in categories))
+        return [name for _, name in islice(matches, limit)]
+
+
+class AutocompleteIndex:
+    """Autocomplétion des noms de chaque utilisateur, à partir de son index de préfixes.
+
+    Un appel servi depuis le cache d'index ne touche jamais au stockage.
+    """
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    async def complete(self, user_id, text, category=None, limit=25):
+        """Retourne les noms de l'utilisateur commençant par le texte."""
+        index = await self.indexes.get(user_id, PrefixIndex)
+        return index.complete(text, category, limit)
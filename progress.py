@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+from collections import Counter
+
+from media import normalize_name
+
+
+class ProgressCoalescer:
+    """Incréments de progression (/next) regroupés en mémoire puis écrits en une fois.
+
+    Les incréments d'un utilisateur sont écrits par un seul `replace_many` après
+    `delay` secondes sans nouvel incrément, et au plus tard `max_delay` secondes
+    après le premier. `settle` les écrit immédiatement, avant toute autre
+    commande de l'utilisateur.
+    """
+
+    def __init__(self, storage, delay=5.0, max_delay=60.0):
+        self.storage = storage
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {}  # user_id → {(catégorie, nom normalisé): Counter(champ → incrément)}
+        self._first = {}    # user_id → heure du premier incrément en attente
+        self._tasks = {}    # user_id → tâche d'écriture différée
+        self.increments = 0
+        self.writes = 0
+
+    async def increment(self, user_id, category, name, field):
+        """Ajoute 1 au champ de progression d'un média.
+
+        Retourne une copie du média avec sa progression à jour (incréments en
+        attente compris), ou None s'il n'est pas dans la liste. Un média qui
+        n'est pas en cours est retourné tel quel, sans incrément.
+        """
+        async with self.storage.lock(user_id):
+            media = await self.storage.find(user_id, category, name)
+            if media is None or media['statut'] != 'en cours':
+                return media
+            deltas = self._pending.setdefault(user_id, {}).setdefault((category, normalize_name(name)), Counter())
+            deltas[field] += 1
+            for pending_field, delta in deltas.items():
+                media[pending_field] = (media.get(pending_field) or 0) + delta
+        self.increments += 1
+        self._schedule(user_id)
+        return media
+
+    def _schedule(self, user_id):
+        loop = asyncio.get_running_loop()
+        first = self._first.setdefault(user_id, loop.time())
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+        delay = max(0, min(self.delay, first + self.max_delay - loop.time()))
+        self._tasks[user_id] = asyncio.create_task(self._settle_later(user_id, delay))
+
+    async def _settle_later(self, user_id, delay):
+        await asyncio.sleep(delay)
+        # Retirée avant l'écriture pour qu'un nouvel incrément ne l'annule pas en cours de route
+        self._tasks.pop(user_id, None)
+        try:
+            await self.settle(user_id)
+        except (OSError, sqlite3.Error) as error:
+            # Les incréments restent en attente : réessayés à la prochaine commande ou à l'arrêt
+            print(f"Échec de l'écriture de la progression de {user_id} : {error}")
+
+    def pending(self, user_id):
+        """Indique si des incréments de l'utilisateur sont en attente."""
+        return user_id in self._pending
+
+    async def settle(self, user_id):
+        """Écrit immédiatement les incréments en attente de l'utilisateur ; retourne le nombre de médias modifiés."""
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+        if user_id not in self._pending:
+            return 0
+        async with self.storage.lock(user_id):
+            pending = self._pending.get(user_id)
+            if not pending:
+                return 0
+            entries = []
+            for (category, key), deltas in pending.items():
+                media = await self.storage.find(user_id, category, key)
+                if media is None or media['statut'] != 'en cours':
+                    # Supprimé ou plus en cours entre-temps (modifié par un autre processus)
+                    continue
+                for field, delta in deltas.items():
+                    media[field] = (media.get(field) or 0) + delta
+                entries.append((category, media))
+            replaced = await self.storage.replace_many(user_id, entries)
+            # Retirés seulement après l'écriture : un échec les laisse en attente
+            del self._pending[user_id]
+            self._first.pop(user_id, None)
+            self.writes += 1
+            return replaced
+
+    async def settle_all(self):
+        """Écrit les incréments en attente de tous les utilisateurs."""
+        for user_id in list(self._pending):
+            await self.settle(user_id)
@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+def format_media_details(media):
+    """Formate la progression d'un média (saison, épisode, volume, chapitre)."""
+    details = []
+    if media.get('saison') is not None:
+        details.append(f"Saison : {media['saison']}")
+    if media.get('episode') is not None:
+        details.append(f"Épisode : {media['episode']}")
+    if media.get('volume') is not None:
+        details.append(f"Volume : {media['volume']}")
+    if media.get('chapitre') is not None:
+        details.append(f"Chapitre : {media['chapitre']}")
+    # Joindre les détails s'ils existent
+    return " - " + ", ".join(details) if details else ""
+
+def format_media_line(media):
+    """Formate la ligne d'un média dans une liste."""
+    return f"- {media['nom']}{format_media_details(media)}"
+
+
+class RenderCache:
+    """Lignes mises en forme par utilisateur, catégorie et statut, gardées en LRU.
+
+    Le cache d'un utilisateur est invalidé dès que la version de ses données
+    (incrémentée à chaque modification) change.
+    """
+
+    def __init__(self, storage, max_users=128):
+        self.storage = storage
+        self.max_users = max_users
+        self._users = OrderedDict()  # user_id → (version, {(catégorie, statut, ordre): lignes})
+        self.hits = 0
+        self.misses = 0
+
+    def _groups(self, user_id, version):
+        cached = self._users.get(user_id)
+        if cached is None or cached[0] != version:
+            cached = self._users[user_id] = (version, {})
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return cached[1]
+
+    async def group_lines(self, user_id, category, statut, reverse=False):
+        """Retourne les lignes des médias d'une catégorie et d'un statut, triées par nom."""
+        version = self.storage.version(user_id)
+        groups = self._groups(user_id, version)
+        key = (category, statut, reverse)
+        if key in groups:
+            self.hits += 1
+            return groups[key]
+
+        self.misses += 1
+        medias = await self.storage.query(user_id, category, statut, reverse)
+        lines = [format_media_line(media) for media in medias]
+        # Ne garde le résultat que si aucune modification n'est survenue pendant la lecture
+        if self.storage.version(user_id) == version:
+            self._groups(user_id, version)[key] = lines
+        return lines
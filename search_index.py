@@ -0,0 +1,133 @@
+import heapq
+import math
+
+from index_cache import MediaIndex
+from media import normalize_name
+
+# Part minimale des trigrammes de la recherche présents dans le nom, pour un résultat approché
+MIN_SCORE = 0.3
+
+# Nombre de noms au-delà duquel les trigrammes suivants, plus fréquents, ne servent plus à trouver
+# les correspondances approchées
+MAX_CANDIDATES = 2000
+
+def trigrams(text):
+    """Retourne l'ensemble des trigrammes d'un texte normalisé, mots bornés par des espaces."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex(MediaIndex):
+    """Index inversé trigramme → médias pour les noms d'un utilisateur."""
+
+    def __init__(self):
+        self._entries = {}   # (catégorie, nom normalisé) → média
+        self._grams = {}     # (catégorie, nom normalisé) → trigrammes du nom
+        self._postings = {}  # trigramme → ensemble de (catégorie, nom normalisé)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def build(cls, data):
+        """Construit l'index de tous les médias de l'utilisateur."""
+        index = cls()
+        for category, medias in data.items():
+            for media in medias:
+                index.add(category, normalize_name(media['nom']), media)
+        return index
+
+    def add(self, category, key, entry):
+        """Ajoute ou remplace un média."""
+        doc = (category, key)
+        if doc in self._entries:
+            self._entries[doc] = entry
+            return
+        self._entries[doc] = entry
+        self._grams[doc] = trigrams(key)
+        for gram in self._grams[doc]:
+            self._postings.setdefault(gram, set()).add(doc)
+
+    def remove(self, category, key):
+        """Retire un média de l'index."""
+        doc = (category, key)
+        if self._entries.pop(doc, None) is None:
+            return
+        for gram in self._grams.pop(doc):
+            postings = self._postings[gram]
+            postings.discard(doc)
+            if not postings:
+                del self._postings[gram]
+
+    def search(self, text, limit=25):
+        """Retourne les meilleurs couples (catégorie, média), du plus au moins pertinent.
+
+        Les noms contenant le texte recherché passent avant les correspondances
+        approchées, qui tolèrent les fautes de frappe. Une recherche de moins de
+        trois lettres ne trouve que les mots qui commencent par elle.
+        """
+        query = normalize_name(text)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+        postings = self._postings
+        ranked = sorted(query_grams, key=lambda gram: len(postings.get(gram, ())))
+
+        # Un nom contenant la recherche contient tous les trigrammes de l'intérieur de ses mots, dont le plus rare ;
+        # à défaut (mots de moins de trois lettres), le début d'un mot
+        anchor = next((gram for gram in ranked if ' ' not in gram), None)
+        if anchor is None:
+            anchor = next((gram for gram in ranked if not gram.endswith(' ')), ranked[0])
+        candidates = set(postings.get(anchor, ()))
+
+        # Un nom assez proche partage au moins un des `needed` trigrammes les plus rares ; les plus fréquents,
+        # peu discriminants, sont écartés une fois le plafond de candidats atteint
+        needed = len(ranked) - math.ceil(MIN_SCORE * len(ranked)) + 1
+        approximate = set()
+        for gram in ranked[:needed]:
+            if approximate and len(approximate) + len(postings.get(gram, ())) > MAX_CANDIDATES:
+                break
+            approximate.update(postings.get(gram, ()))
+        candidates |= approximate
+
+        scored = []
+        size = len(query_grams)
+        for doc in candidates:
+            key = doc[1]
+            doc_grams = self._grams[doc]
+            shared = len(query_grams & doc_grams)
+            # Couverture de la recherche, départagée par la similarité globale (Dice)
+            dice = 2 * shared / (size + len(doc_grams))
+            if key == query:
+                score = 3
+            elif key.startswith(query):
+                score = 2 + dice
+            elif query in key:
+                score = 1 + dice
+            elif shared >= MIN_SCORE * size:
+                score = 0.9 * shared / size + 0.1 * dice
+            else:
+                continue
+            scored.append((-score, key, doc))
+
+        return [(doc[0], self._entries[doc]) for _, _, doc in heapq.nsmallest(limit, scored)]
+
+
+class SearchEngine:
+    """Recherche approchée dans les médias de chaque utilisateur, à partir de son index de trigrammes."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    async def search(self, user_id, text, limit=25):
+        """Retourne les médias les plus proches du texte, par ordre de pertinence."""
+        index = await self.indexes.get(user_id, TrigramIndex)
+        return index.search(text, limit)
+
+    def search_ready(self, user_id, text, limit=25):
+        """Comme `search`, sans attendre la construction de l'index : retourne None tant qu'il n'est pas prêt."""
+        index = self.indexes.peek(user_id, TrigramIndex)
+        return None if index is None else index.search(text, limit)
@@ -0,0 +1,113 @@
+"""Lanceur du mode réparti : plusieurs processus bot.py, chacun chargé d'une plage de shards.
+
+    python shards.py --workers 4               # nombre de shards recommandé par Discord
+    python shards.py --workers 4 --shards 16
+
+Les processus partagent la base SQLite (STORAGE_BACKEND=sqlite imposé) ; un
+processus arrêté par une erreur est relancé.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from sqlite_storage import SqliteStorage
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+# Discord n'accepte qu'une connexion de shard toutes les 5 secondes : les processus démarrent l'un après l'autre
+IDENTIFY_DELAY = 5
+RESTART_DELAY = 5
+
+def recommended_shards(token):
+    """Retourne le nombre de shards recommandé par Discord pour ce bot."""
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(GATEWAY_URL, headers={"Authorization": f"Bot {token}"}) as response:
+                response.raise_for_status()
+                return (await response.json())['shards']
+    return asyncio.run(fetch())
+
+def split_shards(shard_count, workers):
+    """Répartit les shards en plages contiguës, de tailles égales à un près."""
+    size, extra = divmod(shard_count, workers)
+    plan = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (worker < extra)
+        plan.append(list(range(start, end)))
+        start = end
+    return plan
+
+def spawn(worker, shard_ids, shard_count):
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="sqlite",
+        SHARD_COUNT=str(shard_count),
+        SHARD_IDS=",".join(map(str, shard_ids)),
+        SHARD_WORKER=str(worker),
+    )
+    print(f"Processus {worker} : shards {shard_ids[0]} à {shard_ids[-1]} sur {shard_count}")
+    return subprocess.Popen([sys.executable, BOT_PATH], env=env)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lance Watchtrack sur plusieurs processus")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Nombre de processus")
+    parser.add_argument("--shards", type=int, help="Nombre total de shards (recommandé par Discord par défaut)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if os.getenv("STORAGE_BACKEND", "sqlite") != "sqlite":
+        sys.exit("Le mode réparti nécessite STORAGE_BACKEND=sqlite")
+    shard_count = args.shards or recommended_shards(os.getenv("DISCORD_TOKEN"))
+    # Au moins un shard par processus
+    workers = max(1, min(args.workers, shard_count))
+    plan = split_shards(shard_count, workers)
+
+    # Schéma créé ou mis à jour une seule fois, avant le démarrage des processus
+    SqliteStorage(os.getenv("SQLITE_PATH", "watchtrack.db")).close()
+
+    processes = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker, shard_ids in enumerate(plan):
+        if stopping:
+            break
+        processes[worker] = spawn(worker, shard_ids, shard_count)
+        if worker < len(plan) - 1:
+            time.sleep(IDENTIFY_DELAY * len(shard_ids))
+
+    while processes:
+        time.sleep(1)
+        for worker, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del processes[worker]
+                continue
+            print(f"Processus {worker} arrêté (code {code}) : redémarrage dans {RESTART_DELAY} s")
+            time.sleep(RESTART_DELAY)
+            if not stopping:
+                processes[worker] = spawn(worker, plan[worker], shard_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Indisponible sous Windows : le mode réparti n'y est pas pris en charge
+    fcntl = None
+
+from media import PROGRESS_FIELDS, STATUS_BY_VALUE, MediaEntry, normalize_name, to_entry, unique_entry
+from metrics import metrics
+from stats import UserStats
+from storage import BaseStorage, empty_user_data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS medias (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    name_norm TEXT NOT NULL,
+    nom TEXT NOT NULL,
+    statut TEXT NOT NULL,
+    saison INTEGER,
+    episode INTEGER,
+    volume INTEGER,
+    chapitre INTEGER,
+    PRIMARY KEY (user_id, category, name_norm)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS medias_statut ON medias (user_id, category, statut, nom);
+CREATE INDEX IF NOT EXISTS medias_nom ON medias (user_id, category, nom);
+CREATE INDEX IF NOT EXISTS medias_name_norm ON medias (name_norm);
+
+-- Statistiques par utilisateur, catégorie et statut, tenues à jour par les déclencheurs
+CREATE TABLE IF NOT EXISTS media_stats (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    statut TEXT NOT NULL,
+    medias INTEGER NOT NULL,
+    episodes INTEGER NOT NULL,
+    chapitres INTEGER NOT NULL,
+    PRIMARY KEY (user_id, category, statut)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS medias_stats_insert AFTER INSERT ON medias BEGIN
+    INSERT INTO media_stats VALUES (NEW.user_id, NEW.category, NEW.statut, 1, COALESCE(NEW.episode, 0), COALESCE(NEW.chapitre, 0))
+    ON CONFLICT (user_id, category, statut) DO UPDATE SET
+        medias = medias + 1, episodes = episodes + excluded.episodes, chapitres = chapitres + excluded.chapitres;
+END;
+CREATE TRIGGER IF NOT EXISTS medias_stats_delete AFTER DELETE ON medias BEGIN
+    UPDATE media_stats SET
+        medias = medias - 1, episodes = episodes - COALESCE(OLD.episode, 0), chapitres = chapitres - COALESCE(OLD.chapitre, 0)
+    WHERE user_id = OLD.user_id AND category = OLD.category AND statut = OLD.statut;
+END;
+CREATE TRIGGER IF NOT EXISTS medias_stats_update AFTER UPDATE ON medias BEGIN
+    UPDATE media_stats SET
+        medias = medias - 1, episodes = episodes - COALESCE(OLD.episode, 0), chapitres = chapitres - COALESCE(OLD.chapitre, 0)
+    WHERE user_id = OLD.user_id AND category = OLD.category AND statut = OLD.statut;
+    INSERT INTO media_stats VALUES (NEW.user_id, NEW.category, NEW.statut, 1, COALESCE(NEW.episode, 0), COALESCE(NEW.chapitre, 0))
+    ON CONFLICT (user_id, category, statut) DO UPDATE SET
+        medias = medias + 1, episodes = episodes + excluded.episodes, chapitres = chapitres + excluded.chapitres;
+END;
+
+-- Modifications récentes, relues par les autres processus qui partagent la base (mode réparti)
+CREATE TABLE IF NOT EXISTS media_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin INTEGER NOT NULL,
+    changed_at INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    name_norm TEXT NOT NULL
+);
+"""
+
+# Déclencheurs temporaires, propres à chaque connexion d'un processus du mode réparti :
+# les autres connexions (migration, outils) n'alimentent pas `media_changes`
+CHANGE_TRIGGERS = """
+CREATE TEMP TRIGGER IF NOT EXISTS medias_changes_insert AFTER INSERT ON main.medias BEGIN
+    INSERT INTO media_changes (origin, changed_at, user_id, category, name_norm)
+    VALUES ({origin}, CAST(strftime('%s', 'now') AS INTEGER), NEW.user_id, NEW.category, NEW.name_norm);
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS medias_changes_update AFTER UPDATE ON main.medias BEGIN
+    INSERT INTO media_changes (origin, changed_at, user_id, category, name_norm)
+    VALUES ({origin}, CAST(strftime('%s', 'now') AS INTEGER), NEW.user_id, NEW.category, NEW.name_norm);
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS medias_changes_delete AFTER DELETE ON main.medias BEGIN
+    INSERT INTO media_changes (origin, changed_at, user_id, category, name_norm)
+    VALUES ({origin}, CAST(strftime('%s', 'now') AS INTEGER), OLD.user_id, OLD.category, OLD.name_norm);
+END;
+"""
+
+# Version du schéma, stockée dans PRAGMA user_version
+SCHEMA_VERSION = 3
+
+COLUMNS = ['nom', 'statut'] + PROGRESS_FIELDS
+SELECT_COLUMNS = ", ".join(COLUMNS)
+
+def connect(path):
+    """Ouvre une connexion SQLite en mode WAL."""
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+def create_schema(connection):
+    """Crée les tables et les index s'ils n'existent pas, puis met à jour le schéma."""
+    connection.executescript(SCHEMA)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version < 2:
+        renormalize_names(connection)
+    if version < 3:
+        rebuild_stats(connection)
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def renormalize_names(connection):
+    """Recalcule les noms normalisés (version 2 : sans accents ni casse).
+
+    Les médias qui deviennent des doublons sont renommés et signalés, jamais supprimés.
+    """
+    placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+    connection.execute("BEGIN IMMEDIATE")
+    rows = connection.execute(f"SELECT user_id, category, {SELECT_COLUMNS} FROM medias").fetchall()
+    keys = {}  # (user_id, catégorie) → noms normalisés déjà pris
+    renormalized = []
+    for user_id, category, *columns in rows:
+        media = row_to_entry(columns)
+        taken = keys.setdefault((user_id, category), set())
+        entry = unique_entry(media, taken)
+        if entry is not media:
+            print(f"Doublon renommé pour {user_id} dans {category} : « {media.nom} » devient « {entry.nom} »")
+        taken.add(normalize_name(entry.nom))
+        renormalized.append(entry_to_row(user_id, category, entry))
+    connection.execute("DELETE FROM medias")
+    connection.executemany(
+        f"INSERT INTO medias (user_id, category, name_norm, {SELECT_COLUMNS}) VALUES ({placeholders})", renormalized
+    )
+    connection.execute("COMMIT")
+
+def rebuild_stats(connection):
+    """Recalcule entièrement la table `media_stats` à partir des médias."""
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute("DELETE FROM media_stats")
+    connection.execute(
+        "INSERT INTO media_stats SELECT user_id, category, statut, COUNT(*), "
+        "COALESCE(SUM(episode), 0), COALESCE(SUM(chapitre), 0) FROM medias GROUP BY user_id, category, statut"
+    )
+    connection.execute("COMMIT")
+
+def payload_size(rows):
+    """Estime la taille des valeurs de lignes SQLite, en octets (8 par nombre, UTF-8 pour le texte)."""
+    size = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, str):
+                size += len(value.encode("utf-8"))
+            elif value is not None:
+                size += 8
+    return size
+
+def entry_to_row(user_id, category, entry):
+    """Convertit un média en ligne de la table `medias`."""
+    return (user_id, category, normalize_name(entry['nom'])) + tuple(entry.get(column) for column in COLUMNS)
+
+def row_to_entry(row):
+    """Convertit une ligne (dans l'ordre de COLUMNS) en média."""
+    return MediaEntry(row[0], STATUS_BY_VALUE[row[1]], *row[2:])
+
+
+class InterProcessLock:
+    """Verrou d'un utilisateur partagé entre processus.
+
+    Prend le verrou asyncio du processus, puis un verrou exclusif (flock) sur
+    un fichier propre à l'utilisateur, ouvert à chaque acquisition.
+    """
+
+    def __init__(self, lock, path):
+        self._lock = lock
+        self._path = path
+        self._file = None
+
+    async def __aenter__(self):
+        await self._lock.acquire()
+        try:
+            self._file = open(self._path, "a")
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Tenu par un autre processus : l'attente bloquante se fait hors de la boucle et du pool du stockage
+                await asyncio.get_running_loop().run_in_executor(None, fcntl.flock, self._file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            # La fermeture libère le verrou de fichier
+            self._file.close()
+        finally:
+            self._file = None
+            self._lock.release()
+
+
+class SqliteStorage(BaseStorage):
+    """Stockage dans une base SQLite locale, une ligne par média.
+
+    Les filtres et tris sont délégués à des requêtes indexées.
+    Chaque thread du pool utilise sa propre connexion.
+
+    Avec `origin` (mode réparti), plusieurs processus partagent la base : leurs
+    modifications sont inscrites dans `media_changes` et relues par `sync`, et
+    `lock` devient un verrou de fichier commun à tous les processus.
+    """
+
+    def __init__(self, path, max_workers=4, origin=None):
+        super().__init__(max_workers)
+        self.path = path
+        self.origin = origin
+        self._local = threading.local()
+        self._lock_dir = f"{path}.locks"
+        self._last_change = 0
+        connection = connect(path)
+        create_schema(connection)
+        if origin is not None:
+            if fcntl is None:
+                raise RuntimeError("Le mode réparti nécessite fcntl (Linux ou macOS)")
+            os.makedirs(self._lock_dir, exist_ok=True)
+            # Les modifications antérieures au démarrage ne concernent aucun index de ce processus
+            self._last_change = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM media_changes").fetchone()[0]
+        connection.close()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+            if self.origin is not None:
+                connection.executescript(CHANGE_TRIGGERS.format(origin=int(self.origin)))
+        return connection
+
+    def lock(self, user_id):
+        """Retourne le verrou de l'utilisateur, partagé avec les autres processus en mode réparti."""
+        lock = super().lock(user_id)
+        if self.origin is None:
+            return lock
+        return InterProcessLock(lock, os.path.join(self._lock_dir, f"{user_id}.lock"))
+
+    @metrics.timed("watchtrack_storage_seconds", op="sqlite")
+    def _execute(self, sql, params=()):
+        cursor = self._connection().execute(sql, params)
+        if cursor.description is None:
+            if cursor.rowcount > 0:
+                metrics.inc("watchtrack_storage_bytes_written_total", payload_size((params,)), op="sqlite")
+            return cursor.rowcount
+        rows = cursor.fetchall()
+        metrics.inc("watchtrack_storage_bytes_read_total", payload_size(rows), op="sqlite")
+        return rows
+
+    async def load(self, user_id):
+        """Retourne toutes les données de l'utilisateur, par catégorie."""
+        rows = await self._run(
+            self._execute,
+            f"SELECT category, {SELECT_COLUMNS} FROM medias WHERE user_id = ?",
+            (user_id,)
+        )
+        data = empty_user_data()
+        for row in rows:
+            data[row[0]].append(row_to_entry(row[1:]))
+        return data
+
+    async def find(self, user_id, category, name):
+        """Retourne une copie du média portant ce nom, ou None."""
+        rows = await self._run(
+            self._execute,
+            f"SELECT {SELECT_COLUMNS} FROM medias WHERE user_id = ? AND category = ? AND name_norm = ?",
+            (user_id, category, normalize_name(name))
+        )
+        return row_to_entry(rows[0]).to_dict() if rows else None
+
+    async def insert(self, user_id, category, entry):
+        """Ajoute un média ; retourne False s'il est déjà dans la liste."""
+        placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+        entry = to_entry(entry)
+        row = entry_to_row(user_id, category, entry)
+        inserted = await self._run(
+            self._execute,
+            f"INSERT OR IGNORE INTO medias (user_id, category, name_norm, {SELECT_COLUMNS}) VALUES ({placeholders})",
+            row
+        )
+        if inserted:
+            self._notify(user_id, category, row[2], entry)
+        return inserted > 0
+
+    @metrics.timed("watchtrack_storage_seconds", op="sqlite_batch")
+    def _insert_rows(self, rows):
+        # Une seule transaction ; retourne les positions des lignes réellement insérées
+        placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+        sql = f"INSERT OR IGNORE INTO medias (user_id, category, name_norm, {SELECT_COLUMNS}) VALUES ({placeholders})"
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = [i for i, row in enumerate(rows) if connection.execute(sql, row).rowcount]
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        metrics.inc("watchtrack_storage_bytes_written_total", payload_size(rows[i] for i in inserted), op="sqlite_batch")
+        return inserted
+
+    async def insert_many(self, user_id, entries):
+        """Ajoute des couples (catégorie, média) en une seule transaction ; retourne le nombre d'ajouts.
+
+        Les médias déjà présents, ou en double dans `entries`, sont ignorés.
+        """
+        entries = [(category, to_entry(entry)) for category, entry in entries]
+        rows = [entry_to_row(user_id, category, entry) for category, entry in entries]
+        inserted = await self._run(self._insert_rows, rows)
+        for i in inserted:
+            self._notify(user_id, rows[i][1], rows[i][2], entries[i][1])
+        return len(inserted)
+
+    async def replace(self, user_id, category, entry):
+        """Remplace le média portant le même nom ; retourne False s'il est absent."""
+        assignments = ", ".join(f"{column} = ?" for column in COLUMNS)
+        entry = to_entry(entry)
+        row = entry_to_row(user_id, category, entry)
+        updated = await self._run(
+            self._execute,
+            f"UPDATE medias SET {assignments} WHERE user_id = ? AND category = ? AND name_norm = ?",
+            row[3:] + row[:3]
+        )
+        if updated:
+            self._notify(user_id, category, row[2], entry)
+        return updated > 0
+
+    @metrics.timed("watchtrack_storage_seconds", op="sqlite_batch")
+    def _update_rows(self, rows):
+        # Une seule transaction ; retourne les positions des lignes réellement modifiées
+        assignments = ", ".join(f"{column} = ?" for column in COLUMNS)
+        sql = f"UPDATE medias SET {assignments} WHERE user_id = ? AND category = ? AND name_norm = ?"
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            updated = [i for i, row in enumerate(rows) if connection.execute(sql, row[3:] + row[:3]).rowcount]
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        metrics.inc("watchtrack_storage_bytes_written_total", payload_size(rows[i] for i in updated), op="sqlite_batch")
+        return updated
+
+    async def replace_many(self, user_id, entries):
+        """Remplace des couples (catégorie, média) en une seule transaction ; retourne le nombre de remplacements.
+
+        Les médias absents de la liste sont ignorés.
+        """
+        entries = [(category, to_entry(entry)) for category, entry in entries]
+        rows = [entry_to_row(user_id, category, entry) for category, entry in entries]
+        updated = await self._run(self._update_rows, rows)
+        for i in updated:
+            self._notify(user_id, rows[i][1], rows[i][2], entries[i][1])
+        return len(updated)
+
+    async def delete(self, user_id, category, name):
+        """Supprime le média portant ce nom ; retourne False s'il est absent."""
+        key = normalize_name(name)
+        deleted = await self._run(
+            self._execute,
+            "DELETE FROM medias WHERE user_id = ? AND category = ? AND name_norm = ?",
+            (user_id, category, key)
+        )
+        if deleted:
+            self._notify(user_id, category, key, None)
+        return deleted > 0
+
+    async def user_stats(self, user_id):
+        """Retourne les statistiques de l'utilisateur, tenues à jour par la base."""
+        rows = await self._run(
+            self._execute,
+            "SELECT category, statut, medias, episodes, chapitres FROM media_stats WHERE user_id = ? AND medias > 0",
+            (user_id,)
+        )
+        return UserStats.from_rows(rows)
+
+    def _read_changes(self, after):
+        return self._execute(
+            f"SELECT c.seq, c.origin, c.user_id, c.category, c.name_norm, {', '.join('m.' + column for column in COLUMNS)} "
+            "FROM media_changes c LEFT JOIN medias m "
+            "ON m.user_id = c.user_id AND m.category = c.category AND m.name_norm = c.name_norm "
+            "WHERE c.seq > ? ORDER BY c.seq",
+            (after,)
+        )
+
+    async def sync(self):
+        """Notifie aux écouteurs les modifications faites par les autres processus ; retourne leur nombre.
+
+        Chaque média modifié est notifié une fois, avec son état actuel.
+        """
+        if self.origin is None:
+            return 0
+        rows = await self._run(self._read_changes, self._last_change)
+        if not rows:
+            return 0
+        # Deux appels simultanés peuvent se terminer dans le désordre
+        self._last_change = max(self._last_change, rows[-1][0])
+        changes = {}
+        for _, origin, user_id, category, key, *columns in rows:
+            if origin != self.origin:
+                changes[(user_id, category, key)] = row_to_entry(columns) if columns[0] is not None else None
+        for (user_id, category, key), entry in changes.items():
+            self._notify(user_id, category, key, entry)
+        return len(changes)
+
+    async def prune_changes(self, max_age):
+        """Efface les modifications de plus de `max_age` secondes ; retourne leur nombre."""
+        return await self._run(
+            self._execute, "DELETE FROM media_changes WHERE changed_at < ?", (int(time.time() - max_age),)
+        )
+
+    def scan_titles(self):
+        """Retourne (user_id, catégorie, nom normalisé, nom, statut) pour tous les médias de la base."""
+        return self._execute("SELECT user_id, category, name_norm, nom, statut FROM medias")
+
+    async def query(self, user_id, category, statut=None, reverse=False):
+        """Retourne les médias d'une catégorie, filtrés par statut et triés par nom."""
+        order = "DESC" if reverse else "ASC"
+        sql = f"SELECT {SELECT_COLUMNS} FROM medias WHERE user_id = ? AND category = ?"
+        params = (user_id, category)
+        if statut is not None:
+            sql += " AND statut = ?"
+            params += (statut,)
+        rows = await self._run(self._execute, f"{sql} ORDER BY nom {order}", params)
+        return [row_to_entry(row) for row in rows]
@@ -0,0 +1,110 @@
+class UserStats:
+    """Statistiques d'un utilisateur, tenues à jour à chaque modification.
+
+    Pour chaque couple (catégorie, statut) : nombre de médias, total des
+    épisodes et total des chapitres en cours.
+    """
+
+    __slots__ = ('_counts',)
+
+    def __init__(self):
+        self._counts = {}  # (catégorie, statut) → [médias, épisodes, chapitres]
+
+    def _update(self, category, media, sign):
+        counts = self._counts.setdefault((category, media['statut']), [0, 0, 0])
+        counts[0] += sign
+        counts[1] += sign * (media.get('episode') or 0)
+        counts[2] += sign * (media.get('chapitre') or 0)
+
+    def add(self, category, media):
+        """Compte un média ajouté."""
+        self._update(category, media, 1)
+
+    def remove(self, category, media):
+        """Décompte un média supprimé."""
+        self._update(category, media, -1)
+
+    def replace(self, category, old, new):
+        """Met à jour les compteurs après le remplacement d'un média."""
+        self._update(category, old, -1)
+        self._update(category, new, 1)
+
+    @classmethod
+    def from_index(cls, index):
+        """Recalcule les statistiques à partir des médias indexés."""
+        stats = cls()
+        for category, medias in index.items():
+            for media in medias.values():
+                stats.add(category, media)
+        return stats
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Construit les statistiques à partir de lignes (catégorie, statut, médias, épisodes, chapitres)."""
+        stats = cls()
+        for category, statut, *counts in rows:
+            stats._counts[(category, statut)] = list(counts)
+        return stats
+
+    @classmethod
+    def from_json(cls, raw, index):
+        """Relit les statistiques enregistrées, ou les recalcule si elles manquent ou ne
+        correspondent pas au nombre de médias de chaque catégorie."""
+        if isinstance(raw, dict):
+            try:
+                stats = cls.from_rows(
+                    (category, statut, *counts)
+                    for category, statuses in raw.items()
+                    for statut, counts in statuses.items()
+                )
+                if all(stats.count(category) == len(medias) for category, medias in index.items()) \
+                        and all(len(counts) == 3 for counts in stats._counts.values()):
+                    return stats
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return cls.from_index(index)
+
+    def to_json(self):
+        """Retourne les compteurs sous la forme {catégorie: {statut: [médias, épisodes, chapitres]}}."""
+        raw = {}
+        for (category, statut), counts in self._counts.items():
+            if counts[0]:
+                raw.setdefault(category, {})[statut] = list(counts)
+        return raw
+
+    def copy(self):
+        stats = UserStats()
+        stats._counts = {key: list(counts) for key, counts in self._counts.items()}
+        return stats
+
+    def count(self, category=None, statut=None):
+        """Retourne le nombre de médias, éventuellement filtrés par catégorie et statut."""
+        return self._sum(0, category, statut)
+
+    def episodes(self, category=None):
+        """Retourne le total des épisodes suivis."""
+        return self._sum(1, category)
+
+    def chapters(self, category=None):
+        """Retourne le total des chapitres suivis."""
+        return self._sum(2, category)
+
+    def completion(self, category=None):
+        """Retourne la part de médias terminés, entre 0 et 1 (0 pour une liste vide)."""
+        total = self.count(category)
+        return self.count(category, 'terminé') / total if total else 0
+
+    def _sum(self, position, category=None, statut=None):
+        return sum(
+            counts[position]
+            for (counts_category, counts_statut), counts in self._counts.items()
+            if category in (None, counts_category) and statut in (None, counts_statut)
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, UserStats) and self.to_json() == other.to_json()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"UserStats({self.to_json()!r})"
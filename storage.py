@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from media import CATEGORIES, MediaEntry, normalize_name, to_entry, unique_entry
+from metrics import metrics
+from stats import UserStats
+
+# Répertoire pour stocker les fichiers utilisateur
+DATA_DIR = "user_data"
+
+# Version du format des fichiers : 1 (implicite) pour des dictionnaires indentés,
+# 2 pour des lignes compactes [nom, code du statut, progression…]
+USER_DATA_VERSION = 2
+
+def empty_user_data():
+    """Retourne la structure de données d'un nouvel utilisateur."""
+    return {category: [] for category in CATEGORIES}
+
+def decode_user_data(raw):
+    """Convertit le contenu d'un fichier utilisateur, dans l'ancien ou le nouveau format, en médias."""
+    if raw.get('version', 1) > USER_DATA_VERSION:
+        raise ValueError(f"Format de données inconnu : version {raw['version']}")
+    return {category: [MediaEntry.from_json(media) for media in raw.get(category, [])] for category in CATEGORIES}
+
+def encode_user_data(data, stats=None):
+    """Sérialise les données de l'utilisateur dans le format compact, avec ses statistiques."""
+    raw = {'version': USER_DATA_VERSION}
+    for category in CATEGORIES:
+        raw[category] = [to_entry(media).to_row() for media in data.get(category, [])]
+    if stats is not None:
+        raw['stats'] = stats.to_json()
+    return raw
+
+def dump_user_data(raw):
+    """Sérialise en JSON compact, sans indentation ni espaces."""
+    return json.dumps(raw, separators=(',', ':'))
+
+@metrics.timed("watchtrack_storage_seconds", op="read")
+def read_user_file(user_id):
+    """Charge les données de l'utilisateur à partir d'un fichier JSON.
+
+    Retourne les médias par catégorie et les statistiques enregistrées (None si absentes).
+    """
+    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as file:
+            content = file.read()
+        metrics.inc("watchtrack_storage_bytes_read_total", len(content), op="read")
+        # Le numéro de séquence laissé par le mode journalisé est ignoré
+        raw = json.loads(content)
+        return decode_user_data(raw), raw.get('stats')
+    else:
+        return empty_user_data(), None
+
+def atomic_write(file_path, content, op="write"):
+    """Remplace le fichier de façon atomique : fichier temporaire, fsync, puis renommage."""
+    # Contenu JSON en ASCII : sa longueur est sa taille en octets
+    metrics.inc("watchtrack_storage_bytes_written_total", len(content), op=op)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+@metrics.timed("watchtrack_storage_seconds", op="write")
+def write_user_file(user_id, data, stats=None):
+    """Sauvegarde les données de l'utilisateur dans un fichier JSON."""
+    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
+    atomic_write(file_path, dump_user_data(encode_user_data(data, stats)))
+
+
+class UserIndex(dict):
+    """Médias d'un utilisateur par catégorie puis par nom normalisé, avec ses statistiques."""
+
+    __slots__ = ('stats',)
+
+def index_user_data(data, saved_stats=None, user_id=None):
+    """Indexe les médias de chaque catégorie par nom normalisé, dans l'ordre d'ajout.
+
+    Si deux médias ont le même nom normalisé (données enregistrées avant la
+    normalisation des accents et de la casse), les suivants sont renommés et
+    signalés ; le nouveau nom est enregistré à la prochaine écriture. Les
+    statistiques enregistrées sont reprises si elles sont cohérentes avec les
+    médias, recalculées sinon.
+    """
+    index = UserIndex()
+    for category in CATEGORIES:
+        medias = index[category] = {}
+        for media in data.get(category, []):
+            entry = unique_entry(media, medias)
+            if entry is not media:
+                print(f"Doublon renommé pour {user_id} dans {category} : « {media.nom} » devient « {entry.nom} »")
+            medias[normalize_name(entry.nom)] = entry
+    index.stats = UserStats.from_json(saved_stats, index)
+    return index
+
+def user_data_lists(index):
+    """Retourne les données indexées sous leur forme de listes, telle qu'enregistrée."""
+    return {category: list(medias.values()) for category, medias in index.items()}
+
+
+class BaseStorage:
+    """Socle commun des stockages : pool de threads pour les E/S et verrous par utilisateur.
+
+    Les méthodes `insert`, `replace` et `delete` sont atomiques prises isolément ;
+    une lecture suivie d'une modification (comme dans /edit) doit être faite sous
+    `lock(user_id)`. Chaque modification est notifiée aux écouteurs enregistrés
+    par `add_listener`.
+    """
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._locks = weakref.WeakValueDictionary()
+        self._write_locks = weakref.WeakValueDictionary()
+        self._listeners = []
+        self._versions = Counter()
+
+    def add_listener(self, listener):
+        """Enregistre une fonction appelée avec (user_id, catégorie, nom normalisé, média).
+
+        Le média vaut None lorsqu'il a été supprimé.
+        """
+        self._listeners.append(listener)
+
+    def version(self, user_id):
+        """Retourne le numéro de version des données de l'utilisateur, incrémenté à chaque modification."""
+        return self._versions[user_id]
+
+    def _notify(self, user_id, category, key, entry):
+        self._versions[user_id] += 1
+        for listener in self._listeners:
+            listener(user_id, category, key, entry)
+
+    def lock(self, user_id):
+        """Retourne le verrou asyncio propre à l'utilisateur."""
+        return self._get_lock(self._locks, user_id)
+
+    def _write_lock(self, user_id):
+        # Verrou interne, distinct de `lock` : sérialise les modifications et les écritures
+        return self._get_lock(self._write_locks, user_id)
+
+    def _get_lock(self, locks, user_id):
+        lock = locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            locks[user_id] = lock
+        return lock
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def run_in_executor(self, func, *args):
+        """Exécute une fonction coûteuse dans le pool de threads du stockage, hors de la boucle d'événements."""
+        return await self._run(func, *args)
+
+    async def flush(self):
+        """Écrit les modifications en attente et retourne leur nombre."""
+        return 0
+
+    async def sync(self):
+        """Répercute les modifications faites par d'autres processus et retourne leur nombre."""
+        return 0
+
+    def stats(self):
+        """Retourne les compteurs propres au stockage."""
+        return {}
+
+    def close(self):
+        """Libère le pool de threads."""
+        self._executor.shutdown()
+
+
+class JsonStorage(BaseStorage):
+    """Stockage dans un fichier JSON par utilisateur, derrière un cache LRU.
+
+    En mémoire, chaque catégorie est un dictionnaire de `MediaEntry` indexé par nom
+    normalisé : la recherche, l'ajout et la suppression d'un média sont en O(1).
+    Les modifications passent par le cache et sont écrites en différé par `flush`.
+    """
+
+    def __init__(self, cache, max_workers=4):
+        super().__init__(max_workers)
+        self.cache = cache
+
+    def _read(self, user_id):
+        # Lecture sur disque, exécutée dans le pool de threads
+        return index_user_data(*read_user_file(user_id), user_id)
+
+    def _write(self, user_id, index):
+        # Écriture sur disque, exécutée dans le pool de threads
+        write_user_file(user_id, user_data_lists(index), index.stats)
+
+    async def _index(self, user_id):
+        index = self.cache.lookup(user_id)
+        if index is None:
+            # La lecture se fait sous le verrou d'écriture pour ne jamais croiser une écriture
+            async with self._write_lock(user_id):
+                index = await self._load_unlocked(user_id)
+        return index
+
+    async def _load_unlocked(self, user_id):
+        # À appeler sous le verrou d'écriture
+        index = self.cache.lookup(user_id)
+        if index is None:
+            index = self.cache.insert(user_id, await self._run(self._read, user_id))
+        return index
+
+    async def _commit(self, user_id, index, records):
+        # Enregistre les données dans le cache ; l'écriture sur disque est différée
+        self.cache.put(user_id, index)
+
+    async def load(self, user_id):
+        """Retourne toutes les données de l'utilisateur, par catégorie."""
+        return user_data_lists(await self._index(user_id))
+
+    async def find(self, user_id, category, name):
+        """Retourne une copie du média portant ce nom, ou None."""
+        index = await self._index(user_id)
+        media = index[category].get(normalize_name(name))
+        return media.to_dict() if media else None
+
+    async def insert(self, user_id, category, entry):
+        """Ajoute un média ; retourne False s'il est déjà dans la liste."""
+        entry = to_entry(entry)
+        key = normalize_name(entry['nom'])
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            if key in index[category]:
+                return False
+            index[category][key] = entry
+            index.stats.add(category, entry)
+            self._notify(user_id, category, key, entry)
+            await self._commit(user_id, index, [('put', category, entry)])
+            return True
+
+    async def insert_many(self, user_id, entries):
+        """Ajoute des couples (catégorie, média) en une seule écriture ; retourne le nombre d'ajouts.
+
+        Les médias déjà présents, ou en double dans `entries`, sont ignorés.
+        """
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            records = []
+            for category, entry in entries:
+                entry = to_entry(entry)
+                key = normalize_name(entry.nom)
+                if key in index[category]:
+                    continue
+                index[category][key] = entry
+                index.stats.add(category, entry)
+                self._notify(user_id, category, key, entry)
+                records.append(('put', category, entry))
+            if records:
+                await self._commit(user_id, index, records)
+            return len(records)
+
+    async def replace(self, user_id, category, entry):
+        """Remplace le média portant le même nom ; retourne False s'il est absent."""
+        entry = to_entry(entry)
+        key = normalize_name(entry['nom'])
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            if key not in index[category]:
+                return False
+            index.stats.replace(category, index[category][key], entry)
+            index[category][key] = entry
+            self._notify(user_id, category, key, entry)
+            await self._commit(user_id, index, [('put', category, entry)])
+            return True
+
+    async def replace_many(self, user_id, entries):
+        """Remplace des couples (catégorie, média) en une seule écriture ; retourne le nombre de remplacements.
+
+        Les médias absents de la liste sont ignorés.
+        """
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            records = []
+            for category, entry in entries:
+                entry = to_entry(entry)
+                key = normalize_name(entry.nom)
+                if key not in index[category]:
+                    continue
+                index.stats.replace(category, index[category][key], entry)
+                index[category][key] = entry
+                self._notify(user_id, category, key, entry)
+                records.append(('put', category, entry))
+            if records:
+                await self._commit(user_id, index, records)
+            return len(records)
+
+    async def delete(self, user_id, category, name):
+        """Supprime le média portant ce nom ; retourne False s'il est absent."""
+        key = normalize_name(name)
+        async with self._write_lock(user_id):
+            index = await self._load_unlocked(user_id)
+            media = index[category].pop(key, None)
+            if media is None:
+                return False
+            index.stats.remove(category, media)
+            self._notify(user_id, category, key, None)
+            await self._commit(user_id, index, [('del', category, media['nom'])])
+            return True
+
+    async def query(self, user_id, category, statut=None, reverse=False):
+        """Retourne les médias d'une catégorie, filtrés par statut et triés par nom."""
+        index = await self._index(user_id)
+        medias = [media for media in index[category].values() if statut is None or media.statut.value == statut]
+        medias.sort(key=lambda media: media.nom, reverse=reverse)
+        return medias
+
+    async def user_stats(self, user_id):
+        """Retourne une copie des statistiques de l'utilisateur, sans parcourir ses médias."""
+        index = await self._index(user_id)
+        return index.stats.copy()
+
+    def stats(self):
+        """Retourne les compteurs du cache."""
+        return self.cache.stats()
+
+    async def flush(self):
+        """Écrit sur disque les données modifiées et retourne leur nombre."""
+        flushed = 0
+        for user_id, index in self.cache.dirty_items():
+            # Le verrou empêche toute modification pendant la sérialisation
+            async with self._write_lock(user_id):
+                self.cache.mark_clean(user_id)
+                try:
+                    await self._run(self._write, user_id, index)
+                except OSError as error:
+                    # Réessayé au prochain flush
+                    self.cache.mark_dirty(user_id)
+                    print(f"Échec de l'écriture des données de {user_id} : {error}")
+                    continue
+            flushed += 1
+        return flushed
+
+    def close(self):
+        """Écrit les dernières modifications de façon synchrone et libère le pool."""
+        for user_id, index in self.cache.dirty_items():
+            self._write(user_id, index)
+            self.cache.mark_clean(user_id)
+        super().close()
@@ -0,0 +1,207 @@
+import glob
+import heapq
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from media import CATEGORIES, STATUS_BY_CODE, STATUS_BY_VALUE, STATUS_CODES, normalize_name
+from storage import DATA_DIR, atomic_write
+
+# Fichier de l'index global, à côté des fichiers utilisateur
+TITLE_INDEX_PATH = os.path.join(DATA_DIR, "titles_index.json")
+TITLE_INDEX_VERSION = 1
+
+def user_file_paths(data_dir=DATA_DIR):
+    """Retourne les fichiers (instantanés et journaux) des utilisateurs."""
+    return sorted(
+        path for path in glob.glob(os.path.join(data_dir, "*.json")) + glob.glob(os.path.join(data_dir, "*.log"))
+        if os.path.splitext(os.path.basename(path))[0].isdigit()
+    )
+
+def scan_user(user_id):
+    """Retourne les titres d'un utilisateur, sous la forme [(catégorie, nom normalisé, nom, statut)].
+
+    Exécutée dans un processus du pool : lit l'instantané et rejoue le journal éventuel.
+    """
+    from journal import read_journal
+    index, _, _ = read_journal(user_id)
+    return user_id, [
+        (category, key, media.nom, media.statut.value)
+        for category, medias in index.items()
+        for key, media in medias.items()
+    ]
+
+def scan_user_files(data_dir=DATA_DIR, workers=None):
+    """Parcourt en parallèle tous les fichiers utilisateur et produit (user_id, catégorie, nom normalisé, nom, statut)."""
+    user_ids = sorted({int(os.path.splitext(os.path.basename(path))[0]) for path in user_file_paths(data_dir)})
+    if not user_ids:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(user_ids) // ((workers or os.cpu_count() or 1) * 4))
+        for user_id, titles in pool.map(scan_user, user_ids, chunksize=chunksize):
+            for category, key, nom, statut in titles:
+                yield user_id, category, key, nom, statut
+
+def encode_snapshot(snapshot, clean=False):
+    """Sérialise un instantané de `TitleIndex.snapshot` en JSON compact ; `clean` marque un arrêt propre.
+
+    Chaque titre est sérialisé à part : exécutée dans un thread, la fonction
+    rend régulièrement la main à la boucle d'événements, ce que ne ferait pas
+    un seul appel à `json.dumps` sur tout l'index.
+    """
+    titles_by_doc, guilds = snapshot
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    categories = {}
+    for (category, key), (nom, users, _) in titles_by_doc.items():
+        users = {str(user_id): STATUS_CODES[statut] for user_id, statut in users.items()}
+        categories.setdefault(category, []).append(f"{dumps(key)}:{dumps([nom, users])}")
+    titles = ",".join(f"{dumps(category)}:{{{','.join(parts)}}}" for category, parts in categories.items())
+    guilds = dumps({str(guild_id): sorted(members) for guild_id, members in guilds.items()})
+    return f'{{"version":{TITLE_INDEX_VERSION},"clean":{dumps(clean)},"titles":{{{titles}}},"guilds":{guilds}}}'
+
+
+class TitleIndex:
+    """Index inversé global : titre → utilisateurs qui l'ont dans leur liste, avec leur statut.
+
+    Tenu à jour par les notifications du stockage et enregistré dans un seul
+    fichier. Les titres enregistrés ne sont repris qu'après un arrêt propre ;
+    sinon l'index est reconstruit. Les membres de chaque serveur sont ceux qui
+    y ont utilisé le bot, ce qui évite l'intent privilégié des membres.
+    """
+
+    def __init__(self, path=TITLE_INDEX_PATH):
+        self.path = path
+        self._titles = {}       # (catégorie, nom normalisé) → [nom affiché, {user_id: statut}, génération]
+        self._user_titles = {}  # user_id → {(catégorie, nom normalisé): statut}
+        self._guilds = {}       # guild_id → ensemble des user_id
+        self._generation = 0    # Incrémentée à chaque instantané : les titres plus anciens lui sont partagés
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._titles)
+
+    def on_change(self, user_id, category, key, entry):
+        """Répercute une modification du stockage sur l'index."""
+        doc = (category, key)
+        if entry is None:
+            title = self._writable(doc)
+            if title is None or title[1].pop(user_id, None) is None:
+                return
+            if not title[1]:
+                del self._titles[doc]
+            titles = self._user_titles[user_id]
+            del titles[doc]
+            if not titles:
+                del self._user_titles[user_id]
+        else:
+            self.add(user_id, category, key, entry['nom'], entry['statut'])
+        self.dirty = True
+
+    def add(self, user_id, category, key, nom, statut):
+        """Ajoute ou met à jour le statut d'un titre pour un utilisateur."""
+        title = self._writable((category, key))
+        if title is None:
+            title = self._titles[(category, key)] = [nom, {}, self._generation]
+        title[1][user_id] = self._user_titles.setdefault(user_id, {})[(category, key)] = STATUS_BY_VALUE[statut]
+
+    def _writable(self, doc):
+        # Copie sur écriture : un titre partagé avec un instantané est copié avant d'être modifié
+        title = self._titles.get(doc)
+        if title is not None and title[2] != self._generation:
+            title = self._titles[doc] = [title[0], dict(title[1]), self._generation]
+        return title
+
+    def add_member(self, guild_id, user_id):
+        """Enregistre un utilisateur comme membre d'un serveur."""
+        members = self._guilds.setdefault(guild_id, set())
+        if user_id not in members:
+            members.add(user_id)
+            self.dirty = True
+
+    def members(self, guild_id):
+        return self._guilds.get(guild_id, set())
+
+    def watchers(self, guild_id, name, category=None):
+        """Retourne [(catégorie, nom, {user_id: statut})] pour les membres du serveur ayant ce titre."""
+        key = normalize_name(name)
+        members = self.members(guild_id)
+        results = []
+        for category in [category] if category else CATEGORIES:
+            title = self._titles.get((category, key))
+            if title is None:
+                continue
+            users = {user_id: statut.value for user_id, statut in title[1].items() if user_id in members}
+            if users:
+                results.append((category, title[0], users))
+        return results
+
+    def top(self, guild_id, statut, category=None, limit=10):
+        """Retourne les titres les plus fréquents parmi les membres du serveur pour un statut donné.
+
+        Seuls les titres des membres sont parcourus, quelle que soit la taille de l'index.
+        """
+        status = STATUS_BY_VALUE[statut]
+        counts = Counter()
+        for user_id in self.members(guild_id):
+            for doc, user_status in self._user_titles.get(user_id, {}).items():
+                if user_status is status and (category is None or doc[0] == category):
+                    counts[doc] += 1
+        ranking = (((doc[0], self._titles[doc][0]), count) for doc, count in counts.items())
+        return heapq.nsmallest(limit, ranking, key=lambda item: (-item[1], item[0][1]))
+
+    def rebuild(self, rows):
+        """Remplace les titres par ceux de (user_id, catégorie, nom normalisé, nom, statut) ; garde les serveurs."""
+        self._titles = {}
+        self._user_titles = {}
+        for user_id, category, key, nom, statut in rows:
+            self.add(user_id, category, key, nom, statut)
+        self.dirty = True
+
+    def snapshot(self):
+        """Retourne une copie figée de l'index, à sérialiser hors de la boucle d'événements.
+
+        Seul le dictionnaire des titres est copié : les titres modifiés ensuite
+        sont copiés à leur première modification.
+        """
+        self.dirty = False
+        self._generation += 1
+        return dict(self._titles), {guild_id: list(members) for guild_id, members in self._guilds.items()}
+
+    def encode(self, clean=False):
+        """Sérialise l'index en JSON compact ; `clean` marque un arrêt propre."""
+        return encode_snapshot(self.snapshot(), clean)
+
+    def save(self, snapshot, clean=False):
+        """Écrit sur disque un instantané pris par `snapshot` ; peut s'exécuter dans un thread."""
+        atomic_write(self.path, encode_snapshot(snapshot, clean), op="title_index")
+
+    def load(self):
+        """Charge l'index enregistré.
+
+        Les serveurs sont toujours repris ; retourne False si les titres doivent
+        être reconstruits (fichier absent, arrêt brutal ou données plus récentes).
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as file:
+            try:
+                raw = json.load(file)
+            except ValueError:
+                return False
+        if raw.get('version') != TITLE_INDEX_VERSION:
+            return False
+        self._guilds = {int(guild_id): set(members) for guild_id, members in raw.get('guilds', {}).items()}
+        if not raw.get('clean'):
+            return False
+        # Un fichier utilisateur modifié après l'index (hors du bot) impose une reconstruction
+        saved_at = os.path.getmtime(self.path)
+        if any(os.path.getmtime(path) > saved_at for path in user_file_paths(os.path.dirname(self.path) or ".")):
+            return False
+        self._titles = {}
+        self._user_titles = {}
+        for category, titles in raw.get('titles', {}).items():
+            for key, (nom, users) in titles.items():
+                for user_id, code in users.items():
+                    self.add(int(user_id), category, key, nom, STATUS_BY_CODE[code].value)
+        return True
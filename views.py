@@ -0,0 +1,115 @@
+from bisect import bisect_right
+
+import nextcord
+
+from metrics import metrics
+
+# Lignes par page et longueur maximale d'une ligne : 15 × 256 caractères restent
+# sous les limites d'un embed (6000 caractères, 25 champs de 1024 caractères)
+PAGE_SIZE = 15
+MAX_LINE_LENGTH = 256
+MAX_FIELD_LENGTH = 1024
+
+
+class MediaCursor:
+    """Curseur sur des lignes déjà triées et groupées, sous la forme [(titre du groupe, lignes)]."""
+
+    def __init__(self, groups):
+        self.groups = [(title, lines) for title, lines in groups if lines]
+        self._starts = []
+        self.total = 0
+        for _, lines in self.groups:
+            self._starts.append(self.total)
+            self.total += len(lines)
+
+    def rows(self, start, stop):
+        """Itère sur les couples (titre du groupe, ligne) entre deux positions."""
+        group = bisect_right(self._starts, start) - 1
+        position = start
+        while group < len(self.groups) and position < stop:
+            title, lines = self.groups[group]
+            offset = position - self._starts[group]
+            for line in lines[offset:offset + stop - position]:
+                yield title, line
+            position = self._starts[group] + len(lines)
+            group += 1
+
+
+class MediaPaginator(nextcord.ui.View):
+    """Vue paginée d'une liste de médias : seule la page affichée est assemblée en embed."""
+
+    def __init__(self, user_id, title, color, cursor, timeout=180):
+        super().__init__(timeout=timeout)
+        self.user_id = user_id
+        self.title = title
+        self.color = color
+        self.cursor = cursor
+        self.page = 0
+        self.pages = max(1, -(-cursor.total // PAGE_SIZE))
+        self.message = None
+        self._update_buttons()
+
+    @metrics.timed("watchtrack_embed_seconds", view="paginator")
+    def render(self):
+        """Construit l'embed de la page courante."""
+        embed = nextcord.Embed(title=self.title, color=self.color)
+        start = self.page * PAGE_SIZE
+
+        # Regroupe les lignes consécutives d'un même groupe, sans dépasser 1024 caractères par champ
+        fields = []
+        for group_title, line in self.cursor.rows(start, start + PAGE_SIZE):
+            if len(line) > MAX_LINE_LENGTH:
+                line = line[:MAX_LINE_LENGTH - 1] + "…"
+            if fields and fields[-1][0] == group_title and len(fields[-1][1]) + len(line) + 1 <= MAX_FIELD_LENGTH:
+                fields[-1][1] += "\n" + line
+            else:
+                fields.append([group_title, line])
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+
+        embed.set_footer(text=f"Page {self.page + 1}/{self.pages} • {self.cursor.total} médias")
+        return embed
+
+    def _update_buttons(self):
+        self.first.disabled = self.previous.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= self.pages - 1
+
+    async def _show(self, interaction, page):
+        self.page = page
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Seul l'auteur de la commande peut changer de page.", ephemeral=True)
+            return False
+        return True
+
+    @nextcord.ui.button(label="⏮", style=nextcord.ButtonStyle.secondary)
+    async def first(self, button, interaction):
+        await self._show(interaction, 0)
+
+    @nextcord.ui.button(label="◀", style=nextcord.ButtonStyle.primary)
+    async def previous(self, button, interaction):
+        await self._show(interaction, max(self.page - 1, 0))
+
+    @nextcord.ui.button(label="▶", style=nextcord.ButtonStyle.primary)
+    async def next(self, button, interaction):
+        await self._show(interaction, min(self.page + 1, self.pages - 1))
+
+    @nextcord.ui.button(label="⏭", style=nextcord.ButtonStyle.secondary)
+    async def last(self, button, interaction):
+        await self._show(interaction, self.pages - 1)
+
+    async def on_timeout(self):
+        # Retire les boutons une fois la vue expirée
+        if self.message is not None:
+            await self.message.edit(view=None)
+
+    async def send(self, interaction):
+        """Envoie la première page, avec les boutons seulement s'il y a plusieurs pages."""
+        if self.pages == 1:
+            self.stop()
+            await interaction.response.send_message(embed=self.render())
+        else:
+            self.message = await interaction.response.send_message(embed=self.render(), view=self)